@@ -0,0 +1,8 @@
+"""
+    benchmarks
+    ~~~~~~~~~~
+
+    Performance benchmarks of the email parser, run against synthetic repositories. Not part of the distribution.
+
+    Run `python -m benchmarks --help` from the root of the project.
+"""
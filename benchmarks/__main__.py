@@ -0,0 +1,60 @@
+"""
+Generates a synthetic repository and runs the benchmark suite against it.
+"""
+
+import argparse
+import logging
+import shutil
+import sys
+import tempfile
+
+from . import generator, suite
+
+
+def read_args():
+    args = argparse.ArgumentParser(prog='python -m benchmarks')
+    spec = generator.DEFAULT_SPEC
+    args.add_argument('--emails', help='Emails per locale', type=int, default=spec.emails)
+    args.add_argument('--locales', help='Comma separated locales', default=','.join(spec.locales))
+    args.add_argument('--variants', help='Variants of the first placeholder', type=int, default=spec.variants)
+    args.add_argument('--templates', help='Number of templates', type=int, default=spec.templates)
+    args.add_argument('--css-rules', help='Rules in the stylesheet', type=int, default=spec.css_rules)
+    args.add_argument('--placeholders', help='Placeholders per email', type=int, default=spec.placeholders)
+    args.add_argument('--placeholder-size', help='Characters per placeholder', type=int,
+                      default=spec.placeholder_size)
+    args.add_argument('--seed', help='Seed of the generated content', type=int, default=0)
+    args.add_argument('--repeat', help='Timed runs of every benchmark', type=int, default=3)
+    args.add_argument('--workers', help='Worker processes of the build benchmark', type=int)
+    args.add_argument('--only', help='Benchmarks to run', nargs='+', metavar='NAME')
+    args.add_argument('--output', help='Save results as json')
+    args.add_argument('--baseline', help='Compare with results saved with --output')
+    args.add_argument('--tolerance', help='Allowed throughput drop compared to the baseline', type=float, default=0.1)
+    return args.parse_args()
+
+
+def main():
+    args = read_args()
+    # errors of generated content are not what is measured
+    logging.basicConfig(level=logging.CRITICAL)
+    spec = generator.RepositorySpec(args.emails, tuple(args.locales.split(',')), args.variants, args.templates,
+                                    args.css_rules, args.placeholders, args.placeholder_size)
+    root_path = tempfile.mkdtemp()
+    try:
+        emails = generator.generate(root_path, spec, args.seed)
+        results = suite.Suite(root_path, emails, args.repeat, args.workers).run(args.only)
+    finally:
+        shutil.rmtree(root_path)
+
+    print(suite.format_results(results))
+    if args.output:
+        suite.save_results(results, args.output)
+    if args.baseline:
+        slower = suite.regressions(results, args.baseline, args.tolerance)
+        for name, expected, actual in slower:
+            print('%s regressed from %.1f to %.1f ops/s' % (name, expected, actual))
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Generates synthetic email repositories in the layout the parser expects.
+"""
+
+import os
+import random
+from collections import namedtuple
+
+from email_parser import config, const
+from email_parser.model import *
+
+RepositorySpec = namedtuple('RepositorySpec', ['emails', 'locales', 'variants', 'templates', 'css_rules',
+                                               'placeholders', 'placeholder_size'])
+
+DEFAULT_SPEC = RepositorySpec(emails=50, locales=('en', 'fr', 'de'), variants=1, templates=3, css_rules=50,
+                              placeholders=5, placeholder_size=500)
+
+_WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do', 'eiusmod',
+          'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna', 'aliqua', 'secure', 'photos', 'vault')
+_TAGS = ('p', 'a', 'h1', 'h2', 'strong', 'em', 'ul', 'li', 'ol', 'img', 'div', 'span', 'table', 'td')
+_PROPERTIES = {
+    'color': ('#333333', '#FFFFFF', '#C0D9D9'),
+    'font-size': ('14px', '1em', '2.5em'),
+    'line-height': ('1.25em', '20px'),
+    'margin': ('0 auto', '10px 0'),
+    'padding': ('0', '10px 20px'),
+    'font-weight': ('bold', 'normal'),
+    'text-align': ('center', 'left')
+}
+
+_TEMPLATE = '''<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head>
+    <title>{{{{subject}}}}</title>
+</head>
+<body>
+{placeholders}
+    <small>{{{{global_unsubscribe}}}}</small>
+</body>
+</html>
+'''
+
+
+def _markdown(rnd, size):
+    """
+    :returns: markdown of roughly the given size with paragraphs, emphasis, links, lists and images
+    """
+    blocks = []
+    length = 0
+    while length < size:
+        kind = rnd.random()
+        words = ' '.join(rnd.choice(_WORDS) for _ in range(rnd.randint(8, 30)))
+        if kind < 0.1:
+            block = '\n'.join('- %s' % ' '.join(rnd.sample(_WORDS, 3)) for _ in range(rnd.randint(2, 5)))
+        elif kind < 0.15:
+            block = '![%s](/img/%s.png)' % (rnd.choice(_WORDS), rnd.choice(_WORDS))
+        elif kind < 0.4:
+            word = rnd.choice(_WORDS)
+            block = '%s [%s](https://example.com/%s/{link_locale}) **%s**' % (words, word, word, rnd.choice(_WORDS))
+        else:
+            block = words
+        blocks.append(block)
+        length += len(block)
+    return '\n\n'.join(blocks)
+
+
+def _css(rnd, rules):
+    css = []
+    for _ in range(rules):
+        selector = rnd.choice(_TAGS)
+        if rnd.random() < 0.3:
+            selector = '%s %s' % (selector, rnd.choice(_TAGS))
+        properties = rnd.sample(sorted(_PROPERTIES), rnd.randint(1, 4))
+        declarations = ' '.join('%s: %s;' % (prop, rnd.choice(_PROPERTIES[prop])) for prop in properties)
+        css.append('%s { %s }' % (selector, declarations))
+    return '\n'.join(css)
+
+
+def _placeholder_names(spec):
+    return ['content_%d' % idx for idx in range(spec.placeholders)]
+
+
+def _string(name, content, variants):
+    if not variants:
+        return '    <string name="%s"><![CDATA[%s]]></string>' % (name, content)
+    items = ['      <item><![CDATA[%s]]></item>' % content]
+    items.extend('      <item variant="%s"><![CDATA[%s]]></item>' % (variant, variant_content)
+                 for variant, variant_content in variants)
+    return '    <string-array name="%s">\n%s\n    </string-array>' % (name, '\n'.join(items))
+
+
+def _save(content, *path_parts):
+    path = os.path.join(*path_parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as fp:
+        fp.write(content)
+
+
+def generate(root_path, spec=DEFAULT_SPEC, seed=0):
+    """
+    Writes a repository with templates, a stylesheet and emails for every locale into `root_path`.
+
+    :param spec: RepositorySpec with the size of the repository
+    :param seed: seed of the generated content, the same seed generates the same repository
+    :returns: list of generated Email tuples, without globals
+    """
+    rnd = random.Random(seed)
+    templates_path = os.path.join(root_path, config.paths.templates)
+    names = _placeholder_names(spec)
+
+    placeholders_html = '\n'.join('    <div>{{%s}}</div>' % name for name in names)
+    templates = []
+    for idx in range(spec.templates):
+        email_type = EmailType.marketing if idx % 2 else EmailType.transactional
+        template_name = 'template_%d.html' % idx
+        _save(_TEMPLATE.format(placeholders=placeholders_html), templates_path, email_type.value, template_name)
+        templates.append((template_name, email_type))
+    _save(_css(rnd, spec.css_rules), templates_path, 'style' + const.CSS_EXTENSION)
+
+    emails = []
+    for locale in spec.locales:
+        globals_content = _string('unsubscribe', 'Unsubscribe from [updates]({{unsubscribe_link}})', [])
+        global_path = config.pattern.format(locale=locale, name=const.GLOBALS_EMAIL_NAME)
+        _save('<?xml version="1.0" encoding="UTF-8" ?>\n<resources>\n%s\n</resources>\n' % globals_content,
+              root_path, config.paths.source, global_path)
+        for idx in range(spec.emails):
+            name = 'email_%d' % idx
+            template_name, email_type = templates[idx % len(templates)]
+            strings = [_string(const.SUBJECT_PLACEHOLDER, ' '.join(rnd.sample(_WORDS, 5)), [])]
+            for placeholder_idx, placeholder_name in enumerate(names):
+                # the first placeholder differs between variants, like an A/B tested headline
+                variants = []
+                if placeholder_idx == 0:
+                    variants = [('V%d' % variant, _markdown(rnd, spec.placeholder_size))
+                                for variant in range(spec.variants)]
+                strings.append(_string(placeholder_name, _markdown(rnd, spec.placeholder_size), variants))
+            content = '<?xml version="1.0" encoding="UTF-8" ?>\n' \
+                '<resources template="%s" style="style.css" email_type="%s">\n%s\n</resources>\n' % \
+                (template_name, email_type.value, '\n'.join(strings))
+            path = os.path.join(root_path, config.paths.source, config.pattern.format(locale=locale, name=name))
+            _save(content, path)
+            emails.append(Email(name, locale, path))
+    return emails
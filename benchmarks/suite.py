@@ -0,0 +1,210 @@
+"""
+Times the stages of the parser against a generated repository. Every benchmark runs with cold caches, like a fresh
+build process, and is repeated to take the fastest run. Peak memory is measured in an extra run.
+"""
+
+import concurrent.futures
+import json
+import resource
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict, namedtuple
+
+from email_parser import Parser, cmd, const, fs, inliner, placeholder, reader, renderer
+from email_parser.model import *
+
+Result = namedtuple('Result', ['name', 'operations', 'seconds', 'throughput', 'peak_memory'])
+
+
+def _clear_caches():
+    reader.clear_cache()
+    renderer.compile_template.cache_clear()
+    inliner.compile_stylesheet.cache_clear()
+    placeholder.expected_placeholders_file.cache_clear()
+    fs.clear_indexes()
+
+
+def _read_all(root_path, emails):
+    return [(email, ) + tuple(reader.read(root_path, email)) for email in emails]
+
+
+def _contents(placeholders):
+    return [p.get_content() for p in placeholders.values() if p.type != PlaceholderType.raw and p.get_content()]
+
+
+class Suite(object):
+    def __init__(self, root_path, emails, repeat=3, workers=None):
+        """
+        :param root_path: root path of a generated repository
+        :param emails: emails of the repository
+        :param repeat: number of timed runs of every benchmark
+        :param workers: number of worker processes of the build benchmark
+        """
+        self.root_path = root_path
+        self.emails = emails
+        self.repeat = repeat
+        self.workers = workers
+
+    def _measure(self, name, run, setup=None, operations=None):
+        """
+        :param run: function doing the operations, gets the result of `setup`
+        :param setup: function preparing a run, not timed
+        :param operations: number of operations a run does, e.g. rendered emails, defaults to the length of what
+        `setup` returns
+        """
+        times = []
+        for _ in range(self.repeat):
+            _clear_caches()
+            state = setup() if setup else None
+            start = time.perf_counter()
+            run(state)
+            times.append(time.perf_counter() - start)
+
+        _clear_caches()
+        state = setup() if setup else None
+        tracemalloc.start()
+        try:
+            run(state)
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        seconds = min(times)
+        if operations is None:
+            operations = len(state)
+        return Result(name, operations, seconds, operations / seconds if seconds else 0.0, peak_memory)
+
+    def _read(self):
+        return _read_all(self.root_path, self.emails)
+
+    def bench_email_lookup(self):
+        return self._measure('fs.email', lambda _: [fs.email(self.root_path, e.name, e.locale) for e in self.emails],
+                             operations=len(self.emails))
+
+    def bench_read(self):
+        return self._measure('reader.read', lambda _: self._read(), operations=len(self.emails))
+
+    def bench_markdown(self):
+        def setup():
+            return [content for _, _, placeholders in self._read() for content in _contents(placeholders)]
+
+        return self._measure('renderer.markdown', lambda contents: [renderer._md_to_html(c) for c in contents], setup)
+
+    def bench_inline_css(self):
+        def setup():
+            return [(renderer.HtmlRenderer(template, email.locale), renderer._md_to_html(content), template.styles)
+                    for email, template, placeholders in self._read() for content in _contents(placeholders)]
+
+        return self._measure('renderer.inline_css',
+                             lambda items: [html_renderer._inline_css(html, css) for html_renderer, html, css in items],
+                             setup)
+
+    def bench_template(self):
+        def setup():
+            items = []
+            for email, template, placeholders in self._read():
+                html_renderer = renderer.HtmlRenderer(template, email.locale)
+                subject, contents = renderer._split_subject(placeholders)
+                parts = {name: html_renderer._render_placeholder(p) for name, p in contents.items()}
+                items.append((html_renderer, subject, parts))
+            return items
+
+        return self._measure('renderer.template',
+                             lambda items: [r._concat_parts(subject, parts, None) for r, subject, parts in items],
+                             setup)
+
+    def bench_text_direction(self):
+        def setup():
+            items = []
+            for email, template, placeholders in self._read():
+                # rtl locales are the only ones the html is rewritten for
+                html_renderer = renderer.HtmlRenderer(template, 'ar')
+                _, html, _ = renderer.render(email.locale, template, placeholders)
+                items.append((html_renderer, html))
+            return items
+
+        return self._measure('renderer.text_direction',
+                             lambda items: [r._wrap_with_text_direction(html) for r, html in items], setup)
+
+    def bench_html_to_text(self):
+        def setup():
+            return [(renderer.TextRenderer(template, email.locale), renderer._md_to_html(content))
+                    for email, template, placeholders in self._read() for content in _contents(placeholders)]
+
+        return self._measure('renderer.html_to_text',
+                             lambda items: [text_renderer._html_to_text(html) for text_renderer, html in items], setup)
+
+    def bench_render(self):
+        parser = Parser(self.root_path)
+        return self._measure('Parser.render', lambda _: [parser.render(e.name, e.locale) for e in self.emails],
+                             operations=len(self.emails))
+
+    def bench_generate_config(self):
+        defaults = len([email for email in self.emails if email.locale == const.DEFAULT_LOCALE])
+        return self._measure('placeholder.generate_config', lambda _: placeholder.generate_config(self.root_path),
+                             operations=defaults)
+
+    def bench_generate_config_parallel(self):
+        def run(_):
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+                placeholder.generate_config(self.root_path, executor, self.workers)
+
+        defaults = len([email for email in self.emails if email.locale == const.DEFAULT_LOCALE])
+        return self._measure('placeholder.generate_config parallel', run, operations=defaults)
+
+    def bench_build(self):
+        result = self._measure('cmd.parse_emails', lambda _: cmd.parse_emails(self.root_path, workers=self.workers),
+                               operations=len(self.emails))
+        # rendering happens in worker processes, tracemalloc only sees the main one
+        children_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        if sys.platform != 'darwin':
+            children_peak *= 1024
+        return result._replace(peak_memory=max(result.peak_memory, children_peak))
+
+    def benchmarks(self):
+        """
+        :returns: ordered map of benchmark name to function running it
+        """
+        return OrderedDict((name[len('bench_'):], getattr(self, name)) for name in [
+            'bench_email_lookup', 'bench_read', 'bench_markdown', 'bench_inline_css', 'bench_template',
+            'bench_text_direction', 'bench_html_to_text', 'bench_render', 'bench_generate_config',
+            'bench_generate_config_parallel', 'bench_build'
+        ])
+
+    def run(self, only=None):
+        """
+        :param only: names of benchmarks to run or None for all of them
+        :returns: list of Result
+        """
+        return [bench() for name, bench in self.benchmarks().items() if not only or name in only]
+
+
+def format_results(results):
+    lines = ['%-36s %10s %12s %14s %12s' % ('benchmark', 'ops', 'seconds', 'ops/s', 'peak MB')]
+    for result in results:
+        values = (result.name, result.operations, result.seconds, result.throughput, result.peak_memory / 2 ** 20)
+        lines.append('%-36s %10d %12.4f %14.1f %12.2f' % values)
+    return '\n'.join(lines)
+
+
+def save_results(results, path):
+    with open(path, 'w') as fp:
+        json.dump([result._asdict() for result in results], fp, sort_keys=True, indent=const.JSON_INDENT)
+
+
+def regressions(results, baseline_path, tolerance):
+    """
+    :param baseline_path: results saved by `save_results` to compare with
+    :param tolerance: allowed drop of throughput, e.g. 0.1 for 10%
+    :returns: list of (name, baseline throughput, throughput) of benchmarks which got slower
+    """
+    with open(baseline_path) as fp:
+        baseline = {result['name']: result['throughput'] for result in json.load(fp)}
+    slower = []
+    for result in results:
+        expected = baseline.get(result.name)
+        if expected and result.throughput < expected * (1 - tolerance):
+            slower.append((result.name, expected, result.throughput))
+    return slower
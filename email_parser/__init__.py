@@ -9,16 +9,51 @@
 """
 import json
 import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 
-from . import placeholder, fs, reader, renderer, const, config
+from . import placeholder, fs, reader, renderer, const, config, dependencies, instrumentation
 from .model import *
 
 
+def _render_variants(root_path, settings, email_name, locale, variants):
+    """
+    Renders variants of an email, the email is read once and placeholders are rendered once for all of them. Runs in
+    executors too, processes which are spawned get the configuration of the parser from `settings`.
+
+    :returns: list of (subject, text, html) tuples, one per variant, or Nones if the email doesn't exist
+    """
+    if config.settings() != settings:
+        config.init(**settings)
+    with instrumentation.context(name=email_name, locale=locale):
+        email = fs.email(root_path, email_name, locale)
+        if not email:
+            return [None] * len(variants)
+        template, placeholders = reader.read(root_path, email)
+        if not template:
+            return [None] * len(variants)
+        return renderer.render_variants(email.locale, template, placeholders, variants)
+
+
 class Parser:
     def __init__(self, root_path, **kwargs):
         self.root_path = root_path
+        # state of `batch`, every thread has its own
+        self._local = threading.local()
         config.init(**kwargs)
 
+    @property
+    def _batch(self):
+        """
+        writes buffered by `batch` of the current thread, content or None for deletes by (email name, locale)
+        """
+        return getattr(self._local, 'batch', None)
+
+    @_batch.setter
+    def _batch(self, pending):
+        self._local.batch = pending
+
     def __hash__(self):
         return hash(self.root_path)
 
@@ -41,15 +76,64 @@ class Parser:
         return reader.get_email_type(self.root_path, email)
 
     def render(self, email_name, locale, variant=None):
-        email = fs.email(self.root_path, email_name, locale)
-        return self.render_email(email, variant)
+        with instrumentation.context(name=email_name, locale=locale, variant=variant):
+            email = fs.email(self.root_path, email_name, locale)
+            return self.render_email(email, variant)
 
     def render_email(self, email, variant=None):
         if not email:
             return None
-        template, persisted_placeholders = reader.read(self.root_path, email)
-        if template:
-            return renderer.render(email.locale, template, persisted_placeholders, variant)
+        with instrumentation.context(name=email.name, locale=email.locale, variant=variant):
+            template, persisted_placeholders = reader.read(self.root_path, email)
+            if template:
+                return renderer.render(email.locale, template, persisted_placeholders, variant)
+
+    def render_variants(self, email_name, locale):
+        """
+        Renders the email without a variant and with every variant its placeholders have. Placeholders without
+        variants are rendered once for all of them.
+
+        :returns: ordered map of variant name, None for no variant, to (subject, text, html) tuple or None if the
+        email doesn't exist
+        """
+        with instrumentation.context(name=email_name, locale=locale):
+            email = fs.email(self.root_path, email_name, locale)
+            if not email:
+                return None
+            template, placeholders = reader.read(self.root_path, email)
+            if not template:
+                return None
+            variants = [None] + sorted(set(name for p in placeholders.values() for name in p.variants))
+            return OrderedDict(zip(variants, renderer.render_variants(email.locale, template, placeholders, variants)))
+
+    def render_many(self, requests, executor=None):
+        """
+        Renders many emails at once. Requests for the same email share a single read of it and its markdown
+        conversions, templates, styles and globals are loaded once for all of them.
+
+        :param requests: iterable of (email_name, locale) or (email_name, locale, variant) tuples
+        :param executor: optional `concurrent.futures.Executor` rendering the emails in parallel
+        :returns: list of (subject, text, html) tuples, or None for missing emails, in the order of requests
+        """
+        groups = OrderedDict()
+        positions = []
+        for request in requests:
+            email_name, locale, variant = (tuple(request) + (None,))[:3]
+            variants = groups.setdefault((email_name, locale), OrderedDict())
+            positions.append(((email_name, locale), variants.setdefault(variant, len(variants))))
+
+        # emails of a locale next to each other share the same globals
+        keys = sorted(groups, key=lambda key: (key[1], key[0]))
+        settings = config.settings()
+        args = [(self.root_path, settings, name, locale, list(groups[(name, locale)])) for name, locale in keys]
+        if executor:
+            futures = [executor.submit(_render_variants, *group_args) for group_args in args]
+            results = [future.result() for future in futures]
+        else:
+            results = [_render_variants(*group_args) for group_args in args]
+
+        rendered = dict(zip(keys, results))
+        return [rendered[key][idx] for key, idx in positions]
 
     def render_email_content(self, content, locale=const.DEFAULT_LOCALE, variant=None, highlight=None):
         template, persisted_placeholders = reader.read_from_content(self.root_path, content, locale)
@@ -79,18 +163,95 @@ class Parser:
         variants = set([name for _, p in placeholders.items() for name in p.variants.keys()])
         return list(variants)
 
+    @contextmanager
+    def batch(self):
+        """
+        Buffers saves and deletes of emails until the end of the block. The files are then written atomically in one
+        pass and caches and the placeholders config are updated once for all of them. Reads inside the block see
+        emails as they were before it. Nothing is written if the block raises, nested blocks join the outer one. Saves
+        and deletes of other threads are not buffered.
+        """
+        if self._batch is not None:
+            yield self
+            return
+        self._batch = OrderedDict()
+        try:
+            yield self
+            pending = self._batch
+        finally:
+            self._batch = None
+        self._flush(pending)
+
+    def _flush(self, pending):
+        # all emails are written to temporary files first, failing to write any of them leaves every email as it was
+        staged = []
+        try:
+            for (email_name, locale), content in pending.items():
+                if content is not None:
+                    path = fs.email_path(self.root_path, email_name, locale)
+                    staged.append((fs.save_temporary_file(content, path), path))
+            try:
+                for (email_name, locale), content in pending.items():
+                    path = fs.email_path(self.root_path, email_name, locale)
+                    if content is None and os.path.isfile(path):
+                        fs.delete_file(path)
+                while staged:
+                    tmp_path, path = staged[0]
+                    os.replace(tmp_path, path)
+                    staged.pop(0)
+            finally:
+                self._emails_changed(pending)
+        finally:
+            for tmp_path, _ in staged:
+                os.remove(tmp_path)
+
+    def _emails_changed(self, keys):
+        """
+        Updates caches and the placeholders config after emails were saved or deleted.
+
+        :param keys: (email name, locale) tuples of the emails
+        """
+        email_names = []
+        refresh = False
+        for email_name, locale in keys:
+            if email_name == const.GLOBALS_EMAIL_NAME:
+                reader.invalidate_global_placeholders(self.root_path, locale)
+                # globals are part of every email of the locale
+                refresh = refresh or locale == const.DEFAULT_LOCALE
+            elif locale == const.DEFAULT_LOCALE:
+                email_names.append(email_name)
+        if refresh:
+            self.refresh_email_placeholders_config()
+        elif email_names:
+            self.update_email_placeholders_config(*email_names)
+
+    def _save_email_file(self, email_name, locale, content):
+        if self._batch is not None:
+            self._batch[(email_name, locale)] = content
+            return fs.email_path(self.root_path, email_name, locale)
+        return fs.save_email(self.root_path, content, email_name, locale)
+
     def delete_email(self, email_name):
-        emails = fs.emails(self.root_path, email_name=email_name)
-        files = []
+        emails = list(fs.emails(self.root_path, email_name=email_name))
+        files = [email.path for email in emails]
+        if self._batch is not None:
+            locales = set(email.locale for email in emails)
+            for name, locale in list(self._batch):
+                if name == email_name and locale not in locales:
+                    locales.add(locale)
+                    files.append(fs.email_path(self.root_path, email_name, locale))
+            for locale in locales:
+                self._batch[(email_name, locale)] = None
+            return files
         for email in emails:
-            files.append(email.path)
             fs.delete_file(email.path)
-        self.refresh_email_placeholders_config()
+        self.update_email_placeholders_config(email_name)
         return files
 
     def save_email(self, email_name, locale, content):
-        saved_path = fs.save_email(self.root_path, content, email_name, locale)
-        self.refresh_email_placeholders_config()
+        saved_path = self._save_email_file(email_name, locale, content)
+        if self._batch is None:
+            self._emails_changed([(email_name, locale)])
         return saved_path
 
     def save_email_variant_as_default(self, email_name, locales, variant, email_type=None):
@@ -105,7 +266,7 @@ class Parser:
                 email_type = EmailType(template.type)
             content = reader.create_email_content(self.root_path, template.name, template.styles_names,
                                                   placeholders_list, email_type)
-            email_path = fs.save_email(self.root_path, content, email_name, locale)
+            email_path = self._save_email_file(email_name, locale, content)
             paths.append(email_path)
         return paths
 
@@ -159,15 +320,38 @@ class Parser:
 
     def save_template(self, template_filename, template_type, template_content):
         template_type = EmailType(template_type)
-        return fs.save_template(self.root_path, template_filename, template_type, template_content)
+        result = fs.save_template(self.root_path, template_filename, template_type, template_content)
+        reader.invalidate_template(self.root_path, template_filename, template_type)
+        return result
 
-    def refresh_email_placeholders_config(self):
-        placeholders_config = placeholder.generate_config(self.root_path)
+    def refresh_email_placeholders_config(self, executor=None, workers=None):
+        """
+        Generates the placeholders config from all emails.
+
+        :param executor: optional `concurrent.futures.Executor` reading the emails in parallel
+        :param workers: number of workers of the executor, defaults to the number of CPUs
+        """
+        placeholders_config = placeholder.generate_config(self.root_path, executor, workers)
         if placeholders_config:
-            fs.save_file(
-                json.dumps(placeholders_config, sort_keys=True, indent=const.JSON_INDENT),
-                self.get_placeholders_filepath())
-            placeholder.expected_placeholders_file.cache_clear()
+            self._save_placeholders_config(placeholders_config)
+
+    def update_email_placeholders_config(self, *email_names):
+        """
+        Updates placeholders of the given emails in the placeholders config. The whole config is generated if there is
+        no usable one yet.
+        """
+        try:
+            placeholders_config = dict(placeholder.expected_placeholders_file(self.root_path))
+        except (FileNotFoundError, ValueError):
+            return self.refresh_email_placeholders_config()
+        changed = [placeholder.update_config(self.root_path, placeholders_config, name) for name in email_names]
+        if any(changed):
+            self._save_placeholders_config(placeholders_config)
+
+    def _save_placeholders_config(self, placeholders_config):
+        fs.save_file_atomic(
+            json.dumps(placeholders_config, sort_keys=True, indent=const.JSON_INDENT), self.get_placeholders_filepath())
+        placeholder.invalidate_expected_placeholders(self.root_path)
 
     def get_placeholders_filepath(self):
         return os.path.join(self.root_path, const.REPO_SRC_PATH, const.PLACEHOLDERS_FILENAME)
@@ -198,6 +382,15 @@ class Parser:
         email = fs.email(self.root_path, email_name, locale)
         return placeholder.get_email_validation(self.root_path, email)['errors']
 
+    def get_placeholders_validation_report(self, executor=None):
+        """
+        Validates placeholders of all emails of all locales.
+
+        :param executor: optional `concurrent.futures.Executor` reading the emails in parallel
+        :returns: see `placeholder.validation_report`
+        """
+        return placeholder.validation_report(placeholder.validate_emails(self.root_path, executor=executor))
+
     def get_resources(self):
         templates_view = {}
         templates, styles = fs.resources(self.root_path)
@@ -210,6 +403,25 @@ class Parser:
                 templates_view_type[template_name] = tpl_placeholders
         return templates_view, styles, sections_map
 
+    def get_emails_affected_by(self, file_paths):
+        """
+        :param file_paths: changed files, absolute or relative to the root path
+        :return: emails which have to be rendered again, including removed ones
+        """
+        return [email._asdict() for email in dependencies.affected_emails(self.root_path, file_paths)]
+
+    def get_emails_using_template(self, template_filename, template_type=None):
+        index = dependencies.load(self.root_path)
+        return [email._asdict() for email in index.emails_using_template(template_filename, template_type)]
+
+    def get_emails_using_style(self, style_name):
+        index = dependencies.load(self.root_path)
+        return [email._asdict() for email in index.emails_using_style(style_name)]
+
+    def get_emails_using_global(self, placeholder_name, locale=None):
+        index = dependencies.load(self.root_path)
+        return [email._asdict() for email in index.emails_using_global(placeholder_name, locale)]
+
     def get_global_placeholders_map(self, locale=const.DEFAULT_LOCALE):
         global_placeholders = reader.get_global_placeholders(self.root_path, locale)
         return {name: placeholder.get_content() for name, placeholder in global_placeholders.items()}
@@ -3,17 +3,19 @@ Handles command line and calls the email parser with corrent options.
 """
 
 import argparse
+import json
 import logging
 import sys
 import os
 import shutil
-import asyncio
+import time
+import traceback
 import concurrent.futures
-from itertools import islice
-from functools import reduce
-from multiprocessing import Manager
 
-from . import const, Parser, config, fs
+from . import const, Parser, config, fs, manifest, dependencies, scheduler, reader, renderer, timings, shards, \
+    instrumentation, report, placeholder
+from .model import *
+from .watch import Watcher
 
 logger = logging.getLogger(__name__)
 
@@ -24,24 +26,25 @@ class ProgressConsoleHandler(logging.StreamHandler):
     on_same_line = False
     flush_errors = False
 
-    def __init__(self, err_queue, warn_queue, *args, **kwargs):
-        self.err_msgs_queue = err_queue
-        self.warn_msgs_queue = warn_queue
+    def __init__(self, *args, **kwargs):
+        # messages are only logged by the main process, workers return their failures with the results
+        self.err_msgs = []
+        self.warn_msgs = []
         super(ProgressConsoleHandler, self).__init__(*args, **kwargs)
 
     def _store_msg(self, msg, loglevel):
         if loglevel == logging.ERROR:
-            self.err_msgs_queue.put(msg)
+            self.err_msgs.append(msg)
         if loglevel == logging.WARN:
-            self.warn_msgs_queue.put(msg)
+            self.warn_msgs.append(msg)
 
     def error_msgs(self):
-        while not self.err_msgs_queue.empty():
-            yield self.err_msgs_queue.get()
+        msgs, self.err_msgs = self.err_msgs, []
+        return msgs
 
     def warning_msgs(self):
-        while not self.warn_msgs_queue.empty():
-            yield self.warn_msgs_queue.get()
+        msgs, self.warn_msgs = self.warn_msgs, []
+        return msgs
 
     def _print_msg(self, stream, msg, record):
         same_line = hasattr(record, 'same_line')
@@ -64,9 +67,9 @@ class ProgressConsoleHandler(logging.StreamHandler):
             stream.write(self.terminator)
 
     def _flush_errors(self, stream):
-        if not self.err_msgs_queue.empty():
+        if self.err_msgs:
             self._flush_store(stream, self.error_msgs(), 'ERRORS:')
-        if not self.warn_msgs_queue.empty():
+        if self.warn_msgs:
             self._flush_store(stream, self.warning_msgs(), 'WARNINGS:')
 
     def _write_msg(self, stream, msg, record):
@@ -89,11 +92,31 @@ class ProgressConsoleHandler(logging.StreamHandler):
             self.handleError(record)
 
 
+def _shard(value):
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('shard has to be given as i/n, e.g. 1/4')
+    if not 0 < index <= count:
+        raise argparse.ArgumentTypeError('shard index has to be between 1 and %s' % count)
+    return Shard(index, count)
+
+
 def read_args(argsargs=argparse.ArgumentParser):
     logger.debug('reading arguments list')
     args = argsargs(epilog='Brought to you by KeepSafe - www.getkeepsafe.com')
 
     args.add_argument('-i', '--images', help='Images base directory')
+    args.add_argument('--incremental', help='Render only emails which changed since the last build',
+                      action='store_true')
+    args.add_argument('--resume', help='Continue an interrupted build without rendering emails it already rendered',
+                      action='store_true')
+    args.add_argument('--changed', help='Render only emails affected by the given changed files', nargs='+',
+                      metavar='PATH')
+    args.add_argument('--shard', help='Render only the i-th of n parts of the emails, e.g. 1/4', type=_shard)
+    args.add_argument('--profile', help='Report p50/p95/p99 durations of rendering stages', action='store_true')
+    args.add_argument('--report', help='Write a JSON report of the build to the given file', metavar='PATH')
+    args.add_argument('-w', '--workers', help='Number of worker processes, defaults to the number of CPUs', type=int)
     args.add_argument('-vv', '--verbose', help='Generate emails despite errors', action='store_true')
     args.add_argument('-v', '--version', help='Show version', action='store_true')
 
@@ -102,52 +125,258 @@ def read_args(argsargs=argparse.ArgumentParser):
     config_parser = subparsers.add_parser('config')
     config_parser.add_argument('config_name', help='Name of config to generate. Available: `placeholders`')
 
+    watch_parser = subparsers.add_parser('watch', help='Render changed emails as soon as their files are saved')
+    watch_parser.add_argument('--interval', help='Seconds between checks for changes', type=float,
+                              default=const.DEFAULT_WATCH_INTERVAL)
+
+    merge_parser = subparsers.add_parser('merge', help='Combine destination directories of shard builds')
+    merge_parser.add_argument('shards', help='Destination directories of the shard builds', nargs='+', metavar='PATH')
+
+    validate_parser = subparsers.add_parser('validate', help='Check placeholders of all emails against the config')
+    validate_parser.add_argument('--output', help='Write the JSON report to the given file instead of stdout, logs go '
+                                                  'to stderr otherwise',
+                                 metavar='PATH')
+
     return args.parse_args()
 
 
+_parsers = {}
+_workers_settings = {}
+
+
+def _init_worker(root_path, settings):
+    """
+    Prepares the current process for rendering emails of the repository, once per process and configuration.
+    The configuration is passed explicitly because processes which are spawned rather than forked don't inherit it
+    from the main process.
+
+    :param settings: configuration as returned by `config.settings`
+    """
+    if _workers_settings.get(root_path) == settings:
+        return
+    config.init(**settings)
+    _parsers[root_path] = Parser(root_path, **settings)
+    _workers_settings[root_path] = settings
+    logger.debug('worker %d ready', os.getpid())
+
+
+def _preload(root_path, emails):
+    """
+    Loads and compiles templates, stylesheets and global placeholders of the emails up front so rendering them doesn't
+    have to. Resources already cached by the process are not loaded again.
+    """
+    contents, styles = reader.preload(root_path, emails)
+    renderer.preload(contents, styles)
+    logger.debug('worker %d preloaded %d templates and %d stylesheets', os.getpid(), len(contents), len(styles))
+
+
 def _parse_and_save(email, parser):
+    """
+    :returns: sizes of the saved subject, text and html in bytes or None if the email can't be rendered
+    """
     result = parser.render_email(email)
     if result:
         subject, text, html = result
         fs.save_parsed_email(parser.root_path, email, subject, text, html)
-        return True
+        return {'subject': len(subject.encode('utf-8')), 'text': len(text.encode('utf-8')),
+                'html': len(html.encode('utf-8'))}
     else:
-        return False
+        return None
 
 
-def _parse_emails_batch(emails, parser):
-    results = []
-    for email in emails:
-        try:
-            results.append(_parse_and_save(email, parser))
-        except Exception as ex:
-            logger.exception('Cannot _parse_and_save email %s', email, exc_info=ex)
-
-    result = reduce(lambda acc, res: acc and res, results)
-    return result
+def _error(ex):
+    return {'type': type(ex).__name__, 'message': str(ex),
+            'traceback': ''.join(traceback.format_exception(type(ex), ex, ex.__traceback__))}
 
 
-def _parse_emails(loop, root_path):
-    shutil.rmtree(os.path.join(root_path, config.paths.destination), ignore_errors=True)
-    emails = fs.emails(root_path)
-    executor = concurrent.futures.ProcessPoolExecutor(max_workers=const.DEFAULT_WORKER_POOL)
-    tasks = []
-    parser = Parser(root_path)
+def _cache_counts():
+    """
+    :returns: hits and misses of all reader caches of the current process
+    """
+    infos = reader.cache_info().values()
+    return sum(info.hits for info in infos), sum(info.misses for info in infos)
 
-    emails_batch = list(islice(emails, const.DEFAULT_WORKER_POOL))
-    while emails_batch:
-        task = loop.run_in_executor(executor, _parse_emails_batch, emails_batch, parser)
-        tasks.append(task)
-        emails_batch = list(islice(emails, const.DEFAULT_WORKER_POOL))
-    results = yield from asyncio.gather(*tasks)
-    result = reduce(lambda acc, result: True if acc and result else False, results)
-    return result
 
+def _parse_emails_batch(emails, root_path, settings, profile=False):
+    """
+    Renders and saves emails in a worker process. Failures are returned rather than logged, the main process reports
+    them.
 
-def parse_emails(root_path):
-    loop = init_loop()
-    result = loop.run_until_complete(_parse_emails(loop, root_path))
-    return result
+    :param profile: True to record durations of rendering stages
+    :returns: list of RenderResult, one per email
+    """
+    _init_worker(root_path, settings)
+    _preload(root_path, emails)
+    parser = _parsers[root_path]
+    recorder = instrumentation.Recorder() if profile else None
+    results = []
+    with instrumentation.installed(recorder):
+        for email in emails:
+            start = time.perf_counter()
+            hits, misses = _cache_counts()
+            sizes, error = None, None
+            try:
+                sizes = _parse_and_save(email, parser)
+            except Exception as ex:
+                error = _error(ex)
+            seconds = time.perf_counter() - start
+            end_hits, end_misses = _cache_counts()
+            cache = {'hits': end_hits - hits, 'misses': end_misses - misses}
+            events = recorder.flush() if recorder else []
+            results.append(RenderResult(sizes is not None, seconds, sizes, error, cache, events))
+    return results
+
+
+def _plan_build(root_path, incremental, shard=None, resume=False):
+    """
+    Splits emails into the ones to render and the ones which are up to date with the last build.
+
+    :param shard: Shard to build or None for all emails
+    :param resume: True to keep emails rendered by an interrupted build
+
+    :returns: tuple of manifest for the build, list of (email, inputs hash) to render and list of removed emails
+    """
+    hasher = manifest.InputsHasher(root_path)
+    fingerprint = manifest.fingerprint()
+    previous = manifest.Manifest.load(root_path) if incremental or resume else None
+    if resume:
+        previous = manifest.Journal.replay(root_path, fingerprint, previous)
+    if previous is None or previous.fingerprint != fingerprint:
+        shutil.rmtree(os.path.join(root_path, config.paths.destination), ignore_errors=True)
+        previous = manifest.Manifest(fingerprint)
+
+    current = manifest.Manifest(fingerprint)
+    all_emails = list(fs.emails(root_path))
+    emails = shards.select(all_emails, shard) if shard else all_emails
+    to_render = []
+    for email in emails:
+        inputs_hash = hasher(email)
+        if previous.is_fresh(root_path, email, inputs_hash):
+            current.add(email, inputs_hash)
+        else:
+            to_render.append((email, inputs_hash))
+        previous.remove(email)
+
+    # emails of other shards are dropped from the manifest of this shard, their outputs are kept
+    existing = set((email.locale, email.name) for email in all_emails)
+    removed = [email for email in previous if (email.locale, email.name) not in existing]
+    for email in removed:
+        fs.delete_parsed_email(root_path, email)
+    return current, to_render, removed
+
+
+def _plan_changed(root_path, changed):
+    """
+    Plans rendering of emails affected by changed files, other emails are left as they are.
+
+    :returns: same as `_plan_build`
+    """
+    hasher = manifest.InputsHasher(root_path)
+    fingerprint = manifest.fingerprint()
+    build_manifest = manifest.Manifest.load(root_path)
+    if build_manifest is None or build_manifest.fingerprint != fingerprint:
+        build_manifest = manifest.Manifest(fingerprint)
+
+    to_render = []
+    removed = []
+    for email in dependencies.affected_emails(root_path, changed):
+        build_manifest.remove(email)
+        if os.path.isfile(email.path):
+            to_render.append((email, hasher(email)))
+        else:
+            fs.delete_parsed_email(root_path, email)
+            removed.append(email)
+    return build_manifest, to_render, removed
+
+
+def _parse_emails(executor, root_path, workers, incremental=False, changed=None, shard=None, resume=False,
+                  profile=False, report_path=None):
+    """
+    :param report_path: path of the JSON report of the build or None to not write one
+    """
+    build_report = report.BuildReport(workers)
+    # timings outlive the destination directory which is removed by full builds
+    render_timings = timings.Timings.load(root_path)
+    if changed is not None:
+        build_manifest, to_render, removed = _plan_changed(root_path, changed)
+    else:
+        build_manifest, to_render, removed = _plan_build(root_path, incremental, shard, resume)
+    skipped = list(build_manifest)
+    for email in skipped:
+        build_report.add_skipped(email)
+    journal = manifest.Journal(root_path)
+    journal.start(build_manifest)
+
+    inputs_hashes = dict(to_render)
+    emails = list(inputs_hashes)
+    ordered_emails = render_timings.longest_first(emails)
+    saving = render_timings.saving(emails, ordered_emails, workers)
+    settings = config.settings()
+    collector = instrumentation.Collector()
+    built, failed = 0, 0
+    for email, render_result in scheduler.map_chunks(executor, _parse_emails_batch, ordered_emails, workers,
+                                                     root_path, settings, profile):
+        for event in render_result.events:
+            collector.event(event)
+        build_report.add_result(email, render_result)
+        if render_result.rendered:
+            build_manifest.add(email, inputs_hashes[email])
+            journal.add(email, inputs_hashes[email])
+            render_timings.add(email, render_result.seconds)
+            built += 1
+        else:
+            if render_result.error:
+                logger.error('Cannot render email %s for locale %s:\n%s', email.name, email.locale,
+                             render_result.error['traceback'])
+            fs.delete_parsed_email(root_path, email)
+            failed += 1
+    for email in removed:
+        render_timings.remove(email)
+        build_report.add_removed(email)
+    build_manifest.save(root_path)
+    journal.finish()
+    render_timings.save(root_path)
+
+    logger.info('%d emails built, %d failed, %d skipped, %d removed', built, failed, len(skipped), len(removed))
+    if saving > 0:
+        logger.info('rendering the slowest emails first saved an estimated %.2fs', saving)
+    if profile:
+        logger.info('rendering stages:\n%s', collector.report())
+    if report_path:
+        build_report.finish(collector.stats() if profile else None, saving)
+        build_report.save(report_path)
+    return not failed
+
+
+def parse_emails(root_path, incremental=False, changed=None, workers=None, shard=None, resume=False, profile=False,
+                 report_path=None):
+    workers = scheduler.workers_count(workers)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        return _parse_emails(executor, root_path, workers, incremental, changed, shard, resume, profile, report_path)
+
+
+def watch(root_path, interval=const.DEFAULT_WATCH_INTERVAL, workers=None):
+    """
+    Keeps rendering emails affected by saved files. Worker processes stay alive between changes so their caches stay
+    warm.
+    """
+    workers = scheduler.workers_count(workers)
+    watched_paths = [os.path.join(root_path, config.paths.source), os.path.join(root_path, config.paths.templates)]
+    watcher = Watcher(watched_paths, interval)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        _parse_emails(executor, root_path, workers, incremental=True)
+        logger.info('watching %s for changes', ', '.join(watched_paths))
+        try:
+            for changed in watcher:
+                try:
+                    _parse_emails(executor, root_path, workers, changed=changed)
+                except Exception:
+                    # a broken file must not stop watching, the next save can fix it
+                    logger.exception('cannot render emails affected by %s', ', '.join(changed))
+                logger.info('waiting for changes', extra={'flush_errors': True})
+        except KeyboardInterrupt:
+            pass
+    return True
 
 
 def print_version():
@@ -157,45 +386,74 @@ def print_version():
     return True
 
 
-def generate_config(root_path):
+def generate_config(root_path, workers=None):
     logger.info('generating config for placeholders')
-    Parser(root_path).refresh_email_placeholders_config()
+    workers = scheduler.workers_count(workers)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        Parser(root_path).refresh_email_placeholders_config(executor, workers)
     return True
 
 
-def execute_command(args):
+def validate(root_path, output=None, workers=None):
+    workers = scheduler.workers_count(workers)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        validations = placeholder.validate_emails(root_path, executor=executor, workers=workers)
+    validation_report = placeholder.validation_report(validations)
+    content = json.dumps(validation_report, indent=const.JSON_INDENT)
+    if output:
+        fs.save_file_atomic(content, output)
+    else:
+        print(content)
+    logger.info('%d of %d emails have invalid placeholders', validation_report['invalid'], validation_report['emails'])
+    return validation_report['valid']
+
+
+def merge(root_path, shards_paths):
+    try:
+        missing = shards.merge(root_path, shards_paths)
+    except ValueError as e:
+        logger.error('cannot merge shards: %s', e)
+        return False
+    for email in missing:
+        logger.error('email %s for locale %s is missing from the shards', email.name, email.locale)
+    logger.info('%d shards merged', len(shards_paths))
+    return not missing
+
+
+def execute_command(args, root_path):
     if args.command == 'config' and args.config_name == 'placeholders':
-        return generate_config(args)
+        return generate_config(root_path, args.workers)
+    if args.command == 'watch':
+        return watch(root_path, args.interval, args.workers)
+    if args.command == 'merge':
+        return merge(root_path, args.shards)
+    if args.command == 'validate':
+        return validate(root_path, args.output, args.workers)
     return False
 
 
-def init_log(verbose):
+def init_log(verbose, stream=sys.stdout):
     log_level = logging.DEBUG if verbose else logging.INFO
-    error_msgs_queue = Manager().Queue()
-    warning_msgs_queue = Manager().Queue()
-    handler = ProgressConsoleHandler(error_msgs_queue, warning_msgs_queue, stream=sys.stdout)
+    handler = ProgressConsoleHandler(stream=stream)
     logger.setLevel(log_level)
     logger.addHandler(handler)
 
 
-def init_loop():
-    loop = asyncio.get_event_loop()
-    loop.set_debug(False)
-    return loop
-
-
 def main():
     root_path = os.getcwd()
     args = read_args()
-    init_log(args.verbose)
+    # stdout is kept for the report when it isn't written to a file
+    report_on_stdout = args.command == 'validate' and not args.output
+    init_log(args.verbose, sys.stderr if report_on_stdout else sys.stdout)
     if args.images:
         config.base_img_path = args.images
     if args.version:
         result = print_version()
     elif args.command:
-        result = execute_command(args)
+        result = execute_command(args, root_path)
     else:
-        result = parse_emails(root_path)
+        result = parse_emails(root_path, incremental=args.incremental, changed=args.changed, workers=args.workers,
+                              shard=args.shard, resume=args.resume, profile=args.profile, report_path=args.report)
     logger.info('\nAll done', extra={'flush_errors': True})
     sys.exit(0) if result else sys.exit(1)
 
@@ -22,8 +22,21 @@ def init(*,
          _rtl_locales=_default_rtl,
          _lang_mappings=_default_lang_mappings):
     global paths, pattern, base_img_path, rtl_locales, lang_mappings
-    paths = _default_paths
+    paths = _paths
     pattern = _pattern
     base_img_path = _base_img_path
     rtl_locales = _rtl_locales
     lang_mappings = _lang_mappings
+
+
+def settings():
+    """
+    :returns: current configuration as keyword arguments of `init`
+    """
+    return {
+        '_paths': paths,
+        '_pattern': pattern,
+        '_base_img_path': base_img_path,
+        '_rtl_locales': rtl_locales,
+        '_lang_mappings': lang_mappings
+    }
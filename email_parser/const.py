@@ -9,6 +9,10 @@ GLOBALS_EMAIL_NAME = 'global'
 GLOBALS_PLACEHOLDER_PREFIX = 'global_'
 REPO_SRC_PATH = 'src'
 PLACEHOLDERS_FILENAME = 'placeholders_config.json'
+MANIFEST_FILENAME = '.manifest.json'
+DEPENDENCIES_FILENAME = '.dependencies.json'
+TIMINGS_FILENAME = '.timings.json'
+JOURNAL_FILENAME = '.journal.jsonl'
 
 INLINE_TEXT_PATTERN = r'\[{2}(.+)\]{2}'
 IMAGE_PATTERN = '![{}]({}/{})'
@@ -20,5 +24,5 @@ HTML_PARSER = 'lxml'
 LOCALE_PLACEHOLDER = '{link_locale}'
 
 DEFAULT_LOCALE = 'en'
-DEFAULT_WORKER_POOL = 10
+DEFAULT_WATCH_INTERVAL = 0.5
 JSON_INDENT = 4
@@ -0,0 +1,196 @@
+"""
+Dependency index between emails and the templates, styles and global placeholders they are rendered with, as well as
+the email of the default locale for emails which fall back to it.
+"""
+
+import json
+import logging
+import os
+
+from . import config, const, fs, reader
+from .model import *
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+
+
+class DependencyIndex(object):
+    """
+    Index persisted in the destination directory. Entries are refreshed only for emails whose source or template
+    changed since they were indexed.
+    """
+
+    def __init__(self, root_path, emails=None):
+        """
+        :param root_path: root path of repository
+        :param emails: index entries by locale and email name
+        """
+        self.root_path = os.path.realpath(root_path)
+        self.emails = emails or {}
+
+    @staticmethod
+    def filepath(root_path):
+        return os.path.join(root_path, config.paths.destination, const.DEPENDENCIES_FILENAME)
+
+    @classmethod
+    def load(cls, root_path):
+        """
+        :returns: persisted index or an empty one if there is none
+        """
+        try:
+            data = json.loads(fs.read_file(cls.filepath(root_path)))
+        except FileNotFoundError:
+            return cls(root_path)
+        except ValueError:
+            logger.warning('ignoring malformed dependency index %s', cls.filepath(root_path))
+            return cls(root_path)
+        if data.get('version') != INDEX_VERSION:
+            return cls(root_path)
+        return cls(root_path, data['emails'])
+
+    def save(self):
+        data = {'version': INDEX_VERSION, 'emails': self.emails}
+        os.makedirs(os.path.join(self.root_path, config.paths.destination), exist_ok=True)
+        fs.save_file_atomic(json.dumps(data, sort_keys=True, indent=const.JSON_INDENT),
+                            self.filepath(self.root_path))
+
+    def _relative(self, path):
+        if not path:
+            return None
+        return os.path.relpath(os.path.realpath(os.path.join(self.root_path, path)), self.root_path)
+
+    def _stamp(self, relative_path):
+        stamp = relative_path and fs.file_stamp(os.path.join(self.root_path, relative_path))
+        return list(stamp) if stamp else None
+
+    def _is_fresh(self, entry, email):
+        return entry is not None and entry['path'] == self._relative(email.path) and \
+            entry['stamp'] == self._stamp(entry['path']) and \
+            entry['template_stamp'] == self._stamp(entry['template']) and \
+            entry['source_stamp'] == self._stamp(entry['source'])
+
+    def _entry(self, email):
+        resources = reader.get_email_resources(self.root_path, email)
+        relative_path = self._relative(email.path)
+        entry = {
+            'path': relative_path,
+            'stamp': self._stamp(relative_path),
+            'source': None,
+            'source_stamp': None,
+            'template': None,
+            'template_stamp': None,
+            'styles': [],
+            'globals': []
+        }
+        if resources is None:
+            return entry
+        entry['source'] = self._relative(resources.source)
+        entry['source_stamp'] = self._stamp(entry['source'])
+        entry['template'] = self._relative(resources.template)
+        entry['template_stamp'] = self._stamp(entry['template'])
+        entry['styles'] = [self._relative(path) for path in resources.styles]
+        if resources.template:
+            try:
+                _, placeholders = reader.read_template(resources.template)
+            except (ValueError, OSError):
+                # the email still depends on the template, rendering it reports the error
+                return entry
+            entry['globals'] = [name for name in placeholders if name.startswith(const.GLOBALS_PLACEHOLDER_PREFIX)]
+        return entry
+
+    def update(self):
+        """
+        Brings the index up to date with the repository.
+
+        :returns: True if any entry changed
+        """
+        changed = False
+        emails = {}
+        for email in fs.emails(self.root_path):
+            entry = self.emails.get(email.locale, {}).get(email.name)
+            if not self._is_fresh(entry, email):
+                entry = self._entry(email)
+                changed = True
+            emails.setdefault(email.locale, {})[email.name] = entry
+        changed = changed or emails.keys() != self.emails.keys() or \
+            any(emails[locale].keys() != self.emails[locale].keys() for locale in emails)
+        self.emails = emails
+        return changed
+
+    def _items(self):
+        for locale, names in sorted(self.emails.items()):
+            for name, entry in sorted(names.items()):
+                yield Email(name, locale, os.path.join(self.root_path, entry['path'])), entry
+
+    def _global_path(self, locale):
+        return self._relative(fs.global_email(self.root_path, locale).path)
+
+    def _find(self, predicate):
+        return [email for email, entry in self._items() if predicate(email, entry)]
+
+    def emails_using_template(self, template_filename, template_type=None):
+        """
+        :param template_filename: name of the template file
+        :param template_type: email type of the template or None for the first type having such a template, like
+            `reader.get_template_parts` resolves it
+        """
+        try:
+            template_types = [EmailType(template_type)]
+        except ValueError:
+            template_types = list(EmailType)
+        paths = [self._relative(str(fs.get_template_filepath(self.root_path, template_filename, email_type.value)))
+                 for email_type in template_types]
+        existing_paths = [path for path in paths if os.path.isfile(os.path.join(self.root_path, path))]
+        template_path = (existing_paths or paths)[0]
+        return self._find(lambda _, entry: entry['template'] == template_path)
+
+    def emails_using_style(self, style_name):
+        style_path = self._relative(os.path.join(config.paths.templates, style_name))
+        return self._find(lambda _, entry: style_path in entry['styles'])
+
+    def emails_using_global(self, placeholder_name, locale=None):
+        """
+        :param placeholder_name: global placeholder name, with or without the globals prefix
+        :param locale: locale of global.xml or None for all locales
+        """
+        if not placeholder_name.startswith(const.GLOBALS_PLACEHOLDER_PREFIX):
+            placeholder_name = const.GLOBALS_PLACEHOLDER_PREFIX + placeholder_name
+        return self._find(lambda email, entry: placeholder_name in entry['globals'] and locale in (None, email.locale))
+
+    def affected(self, paths):
+        """
+        :param paths: changed files, absolute or relative to the root path
+        :returns: emails which have to be rendered again
+        """
+        changed = set(self._relative(path) for path in paths)
+
+        def is_affected(email, entry):
+            return entry['path'] in changed or entry['source'] in changed or entry['template'] in changed or \
+                any(style in changed for style in entry['styles']) or \
+                (entry['globals'] and self._global_path(email.locale) in changed)
+
+        return self._find(is_affected)
+
+
+def load(root_path):
+    """
+    :returns: up to date dependency index for the repository
+    """
+    index = DependencyIndex.load(root_path)
+    if index.update():
+        index.save()
+    return index
+
+
+def affected_emails(root_path, paths):
+    """
+    :returns: emails affected by changed files, including emails whose source was removed
+    """
+    index = DependencyIndex.load(root_path)
+    affected = index.affected(paths)
+    if index.update():
+        index.save()
+    known = set(affected)
+    affected.extend(email for email in index.affected(paths) if email not in known)
+    return sorted(affected, key=lambda email: (email.locale, email.name))
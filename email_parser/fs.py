@@ -4,15 +4,23 @@ All filesystem interaction.
 
 import logging
 import os
-import parse
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
 from pathlib import Path
 from string import Formatter
 
-from . import const, config
+import parse
+
+from . import const, config, instrumentation
 from .model import *
 
 logger = logging.getLogger(__name__)
 
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
 
 def _parse_params(pattern):
     params = [p for p in map(lambda e: e[1], Formatter().parse(pattern)) if p]
@@ -29,22 +37,134 @@ def _has_correct_ext(path, pattern):
     return os.path.splitext(str(path))[1] == os.path.splitext(pattern)[1]
 
 
-# TODO extract globals
-def _emails(root_path, pattern, params):
+@lru_cache(maxsize=None)
+def _compile_pattern(pattern):
+    return parse.compile(pattern)
+
+
+class EmailIndex(object):
+    """
+    Emails in the source directory by (name, locale). Directories are scanned once and rescanned only when their
+    mtime changes, lookups of known emails cost a single stat of the email's directory.
+    """
+    # directories modified this recently may still change within their current mtime
+    racy_interval_ns = 2 * 10 ** 9
+
+    def __init__(self, source_path, pattern):
+        _parse_params(pattern)
+        self.source_path = source_path
+        self.pattern = pattern
+        self._parser = _compile_pattern(pattern)
+        self._depth = pattern.count('/')
+        self._dirs = {}
+        self._emails = {}
+        self._lock = threading.Lock()
+
+    def _dir_stamp(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _scan_dir(self, path, level):
+        subdirs = []
+        emails = {}
+        try:
+            entries = list(os.scandir(path))
+        except (FileNotFoundError, NotADirectoryError):
+            entries = []
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                if level < self._depth:
+                    subdirs.append(entry.path)
+            elif level == self._depth and _has_correct_ext(entry.name, self.pattern):
+                str_path = os.path.relpath(entry.path, self.source_path)
+                result = self._parser.parse(str_path)
+                # HACK: result can be empty when pattern doesn't contain any placeholder
+                if result and not str_path.endswith(const.GLOBALS_EMAIL_NAME + const.SOURCE_EXTENSION):
+                    email = Email(result.named['name'], result.named['locale'], os.path.realpath(entry.path))
+                    emails[(email.name, email.locale)] = (str_path, email)
+        return subdirs, emails
+
+    def _refresh_dir(self, path, level, scan_start):
+        """
+        :returns: True if the directory or any of its subdirectories changed
+        """
+        stamp = self._dir_stamp(path)
+        cached = self._dirs.get(path)
+        changed = cached is None or cached[0] != stamp or cached[1]
+        if changed:
+            logger.debug('scanning %s', path)
+            subdirs, emails = self._scan_dir(path, level)
+            racy = stamp is not None and scan_start - stamp < self.racy_interval_ns
+            self._dirs[path] = (stamp, racy, subdirs, emails)
+        else:
+            subdirs = cached[2]
+        for subdir in subdirs:
+            changed = self._refresh_dir(subdir, level + 1, scan_start) or changed
+        return changed
+
+    def refresh(self):
+        with self._lock:
+            if self._refresh_dir(self.source_path, 0, int(time.time() * 10 ** 9)):
+                known_dirs = set()
+                self._collect_dirs(self.source_path, known_dirs)
+                self._dirs = {path: entry for path, entry in self._dirs.items() if path in known_dirs}
+                self._emails = {key: value for path in known_dirs for key, value in self._dirs[path][3].items()}
+
+    def _collect_dirs(self, path, known_dirs):
+        known_dirs.add(path)
+        for subdir in self._dirs[path][2]:
+            self._collect_dirs(subdir, known_dirs)
+
+    def get(self, email_name, locale):
+        """
+        :returns: Email or None if there is no such email
+        """
+        found = self._emails.get((email_name, locale))
+        if found:
+            email_dir = os.path.dirname(os.path.join(self.source_path, found[0]))
+            cached = self._dirs.get(email_dir)
+            if cached is not None and not cached[1] and cached[0] == self._dir_stamp(email_dir):
+                return found[1]
+        self.refresh()
+        found = self._emails.get((email_name, locale))
+        return found[1] if found else None
+
+    def all(self):
+        """
+        :returns: all emails sorted by path
+        """
+        self.refresh()
+        return [email for _, email in sorted(self._emails.values(), key=lambda item: item[0])]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def email_index(root_path):
+    """
+    :returns: shared EmailIndex for the repository and current configuration
+    """
     source_path = os.path.join(root_path, config.paths.source)
-    wildcard_params = {k: '*' for k in params}
-    wildcard_pattern = pattern.format(**wildcard_params)
-    parser = parse.compile(pattern)
-    glob_path = Path(source_path).glob(wildcard_pattern)
-    for path in sorted(glob_path, key=lambda path: str(path)):
-        if not path.is_dir() and _has_correct_ext(path, pattern):
-            str_path = str(path.relative_to(source_path))
-            result = parser.parse(str_path)
-            if result:  # HACK: result can be empty when pattern doesn't contain any placeholder
-                result.named['path'] = str(path.resolve())
-                if not str_path.endswith(const.GLOBALS_EMAIL_NAME + const.SOURCE_EXTENSION):
-                    logger.debug('loading email %s', result.named['path'])
-                    yield result
+    key = (os.path.realpath(source_path), config.pattern)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = EmailIndex(source_path, config.pattern)
+            _indexes[key] = index
+    return index
+
+
+def clear_indexes():
+    """
+    Drops the shared EmailIndex instances, the next `email_index` scans the source directory again
+    """
+    with _indexes_lock:
+        _indexes.clear()
 
 
 def get_email_filepath(email_name, locale):
@@ -71,45 +191,29 @@ def emails(root_path, email_name=None, locale=None):
     """
     Resolves a pattern to a collection of emails.
 
-    :param src_dir: base dir for the search
-    :param pattern: search pattern
-    :exclusive_path: single email path, glob path for emails subset or None to not affect emails set
+    :param root_path: root path of repository
+    :param email_name: email name or None for all emails
+    :param locale: locale name or None for all locales
 
     :returns: generator for the emails matching the pattern
     """
-    params = _parse_params(config.pattern)
-    pattern = config.pattern
-    if email_name:
-        pattern = pattern.replace('{name}', email_name)
-    if locale:
-        pattern = pattern.replace('{locale}', locale)
-    for result in _emails(root_path, pattern, params):
-        if email_name:
-            result.named['name'] = email_name
-        if locale:
-            result.named['locale'] = locale
-        yield Email(**result.named)
+    for email in email_index(root_path).all():
+        if (email_name is None or email.name == email_name) and (locale is None or email.locale == locale):
+            yield email
 
 
+@instrumentation.timed('fs.email')
 def email(root_path, email_name, locale):
     """
     Gets an email by name and locale
 
-    :param src_dir: base dir for the search
-    :param pattern: search pattern
+    :param root_path: root path of repository
     :param email_name: email name
-    :param locale: locale name or None for all locales
+    :param locale: locale name
 
-    :returns: generator for the emails with email_name
+    :returns: Email or None if there is no such email
     """
-    params = _parse_params(config.pattern)
-    pattern = config.pattern.replace('{name}', email_name)
-    pattern = pattern.replace('{locale}', locale)
-    for result in _emails(root_path, pattern, params):
-        result.named['name'] = email_name
-        result.named['locale'] = locale
-        return Email(**result.named)
-    return None
+    return email_index(root_path).get(email_name, locale)
 
 
 def global_email(root_path, locale):
@@ -117,6 +221,69 @@ def global_email(root_path, locale):
     return Email(const.GLOBALS_EMAIL_NAME, locale, path)
 
 
+def file_stamp(path):
+    """
+    Returns (mtime, size) of a file or None if the file can't be stat'ed
+    """
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class FileCache(object):
+    """
+    Thread safe cache for values built from files. Each entry remembers (mtime, size) of every file it was built from
+    and is rebuilt on the next lookup once any of them changes. Values built from files which can't be stat'ed are
+    never stored.
+    """
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, paths, loader):
+        """
+        :param key: hashable cache key
+        :param paths: paths of files the value is built from
+        :param loader: callable building the value on a miss
+        """
+        stamps = tuple(file_stamp(path) for path in paths)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and None not in stamps and entry[0] == stamps:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[1]
+            self.misses += 1
+        value = loader()
+        if None not in stamps:
+            with self._lock:
+                self._entries[key] = (stamps, value)
+                self._entries.move_to_end(key)
+                while self.maxsize is not None and len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+
 def read_file(*path_parts):
     """
     Helper for reading files
@@ -137,6 +304,44 @@ def save_file(content, *path_parts):
         return fp.write(content)
 
 
+def save_file_atomic(content, *path_parts):
+    """
+    Helper for saving files, readers see either the old or the new content but never a partially written file
+    """
+    path = os.path.join(*path_parts)
+    logger.debug('saving file to %s', path)
+    tmp_path = save_temporary_file(content, path)
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return len(content)
+
+
+def save_temporary_file(content, *path_parts):
+    """
+    Writes content to a temporary file next to the path, with the permissions of the file at the path. Replacing the
+    path with it saves the content atomically.
+
+    :returns: path of the temporary file
+    """
+    path = os.path.join(*path_parts)
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o644
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.', suffix='.tmp')
+    try:
+        with open(fd, 'w') as fp:
+            fp.write(content)
+        os.chmod(tmp_path, mode)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
 def delete_file(*path_parts):
     """
     Helper for deleting files
@@ -146,10 +351,14 @@ def delete_file(*path_parts):
     os.remove(path)
 
 
-def save_email(root_path, content, email_name, locale):
+def email_path(root_path, email_name, locale):
     pattern = config.pattern.replace('{locale}', locale)
     pattern = pattern.replace('{name}', email_name)
-    path = os.path.join(root_path, config.paths.source, pattern)
+    return os.path.join(root_path, config.paths.source, pattern)
+
+
+def save_email(root_path, content, email_name, locale):
+    path = email_path(root_path, email_name, locale)
     save_file(content, path)
     return path
 
@@ -160,6 +369,31 @@ def save_template(root_path, template_filename, template_type, template_content)
     return path, written
 
 
+def parsed_email_filepaths(root_path, email):
+    """
+    :returns: paths of subject, text and html files rendered for the email
+    """
+    locale = email.locale or const.DEFAULT_LOCALE
+    folder = os.path.join(root_path, config.paths.destination, locale)
+    return [os.path.join(folder, email.name + ext)
+            for ext in (const.SUBJECT_EXTENSION, const.TEXT_EXTENSION, const.HTML_EXTENSION)]
+
+
+def parsed_email_exists(root_path, email):
+    return all(os.path.isfile(path) for path in parsed_email_filepaths(root_path, email))
+
+
+def delete_parsed_email(root_path, email):
+    """
+    Deletes rendered files of an email, missing files are ignored
+    """
+    for path in parsed_email_filepaths(root_path, email):
+        try:
+            delete_file(path)
+        except FileNotFoundError:
+            pass
+
+
 def save_parsed_email(root_path, email, subject, text, html):
     """
     Saves an email. The locale and name are taken from email tuple.
@@ -0,0 +1,111 @@
+"""
+Inlines CSS into html fragments. Stylesheets are parsed and their selectors compiled once, then reused for every
+fragment they are applied to. The output is the same as the one of `inlinestyler.utils.inline_css`.
+"""
+
+import re
+from functools import lru_cache
+
+import cssutils
+import inlinestyler.utils as inline_styler
+from inlinestyler.cssselect import CSSSelector, ExpressionError
+from lxml import etree
+
+# elements inlinestyler doesn't set styles for
+_IGNORED_TAGS = ('html', 'head', 'title', 'meta', 'link', 'script')
+_INLINE_SPECIFICITY = (1, 0, 0, 0)
+_STYLE_SELECTOR = CSSSelector('style,Style')
+# fragments bringing their own styles need the full inlinestyler treatment
+_EXTERNAL_STYLES_RE = re.compile(r'<\s*(style|link)\b', re.IGNORECASE)
+
+
+class CompiledStylesheet(object):
+    def __init__(self, css):
+        """
+        :param css: style elements as rendered by `reader.get_inline_style`
+        """
+        self.css = css
+        self._selectors = []
+        self._styles = {}
+        document = etree.HTML(css)
+        aggregate_css = ''
+        if document is not None:
+            aggregate_css = ''.join(element.text or '' for element in _STYLE_SELECTOR(document))
+        sheet = cssutils.parseString(aggregate_css)
+        for rule in sheet:
+            if rule.type != rule.STYLE_RULE:
+                continue
+            for selector in rule.selectorList:
+                try:
+                    compiled_selector = CSSSelector(selector.selectorText)
+                except ExpressionError:
+                    continue
+                self._selectors.append((compiled_selector, selector.specificity, rule.style))
+
+    def _style(self, inline_style, matched):
+        """
+        Resolves the style attribute for an element, following inlinestyler cascading rules.
+
+        :param inline_style: value of the element's style attribute
+        :param matched: indexes of selectors matching the element, in stylesheet order
+        """
+        key = (inline_style, matched)
+        style = self._styles.get(key)
+        if style is not None:
+            return style
+        declaration = cssutils.css.CSSStyleDeclaration()
+        specificities = {}
+        if inline_style:
+            for prop in cssutils.css.CSSStyleDeclaration(cssText=inline_style):
+                declaration.setProperty(prop)
+                specificities[prop.name] = _INLINE_SPECIFICITY
+        for idx in matched:
+            _, specificity, rule_style = self._selectors[idx]
+            for prop in rule_style:
+                if prop not in declaration:
+                    declaration.setProperty(prop.name, prop.value, prop.priority)
+                    specificities[prop.name] = specificity
+                else:
+                    same_priority = prop.priority == declaration.getPropertyPriority(prop.name)
+                    if (not same_priority and bool(prop.priority)) or \
+                            (same_priority and specificity >= specificities[prop.name]):
+                        declaration.setProperty(prop.name, prop.value, prop.priority)
+        style = declaration.getCssText(separator='')
+        self._styles[key] = style
+        return style
+
+    def inline(self, html):
+        """
+        :returns: complete html document with styles inlined into the elements of the html fragment
+        """
+        if _EXTERNAL_STYLES_RE.search(html):
+            return inline_styler.inline_css(self.css + html)
+
+        document = etree.HTML(self.css + html)
+        for element in _STYLE_SELECTOR(document):
+            element.getparent().remove(element)
+
+        matches = {}
+        for idx, (selector, _, _) in enumerate(self._selectors):
+            try:
+                elements = selector(document)
+            except ExpressionError:
+                continue
+            for element in elements:
+                matches.setdefault(element, []).append(idx)
+
+        for element, matched in matches.items():
+            if element.tag not in _IGNORED_TAGS:
+                element.set('style', self._style(element.get('style'), tuple(matched)))
+
+        converted = etree.tostring(document, method='xml', pretty_print=True, encoding='UTF-8')
+        return converted.decode('UTF-8').replace('&#13;', '')
+
+
+@lru_cache(maxsize=64)
+def compile_stylesheet(css):
+    return CompiledStylesheet(css)
+
+
+def inline_css(css, html):
+    return compile_stylesheet(css).inline(html)
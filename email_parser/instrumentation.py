@@ -0,0 +1,166 @@
+"""
+Timing of the stages emails are rendered in. Stages report their duration to the installed instrument together with
+the email, locale and variant being rendered. The default instrument ignores them and stages aren't timed at all.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+from .model import *
+
+
+class Instrument(object):
+    """
+    Receives stage events. Subclasses override `event`, the base class does nothing.
+    """
+
+    def event(self, event):
+        """
+        :param event: StageEvent
+        """
+        pass
+
+
+_default_instrument = Instrument()
+_instrument = _default_instrument
+_context = threading.local()
+
+
+def set_instrument(instrument):
+    """
+    :param instrument: Instrument receiving events of all threads or None for the default one
+    :returns: previously installed instrument
+    """
+    global _instrument
+    previous = _instrument
+    _instrument = instrument or _default_instrument
+    return previous
+
+
+def get_instrument():
+    return _instrument
+
+
+@contextmanager
+def installed(instrument):
+    """
+    Installs an instrument for the duration of the block.
+    """
+    previous = set_instrument(instrument)
+    try:
+        yield instrument
+    finally:
+        set_instrument(previous)
+
+
+@contextmanager
+def context(**values):
+    """
+    Sets what is being rendered in the current thread for the duration of the block. Values which aren't given are
+    inherited from the enclosing block.
+
+    :param values: any of `name`, `locale` and `variant`
+    """
+    previous = dict(_context.__dict__)
+    _context.__dict__.update(values)
+    try:
+        yield
+    finally:
+        _context.__dict__.clear()
+        _context.__dict__.update(previous)
+
+
+def timed(stage):
+    """
+    Decorator reporting the duration of every call as the given stage.
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            current = _instrument
+            if current is _default_instrument:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                values = _context.__dict__
+                current.event(StageEvent(stage, seconds, values.get('name'), values.get('locale'),
+                                         values.get('variant')))
+
+        return wrapper
+
+    return decorator
+
+
+class Recorder(Instrument):
+    """
+    Keeps events in the order they happened.
+    """
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def event(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def flush(self):
+        """
+        :returns: events recorded since the last flush
+        """
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+
+def _percentile(sorted_values, percent):
+    # nearest rank
+    rank = max(1, int(math.ceil(percent / 100.0 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+class Collector(Instrument):
+    """
+    Aggregates durations of stages, e.g. across a build.
+    """
+    percentiles = (50, 95, 99)
+
+    def __init__(self):
+        self._durations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def event(self, event):
+        with self._lock:
+            self._durations.setdefault(event.stage, []).append(event.seconds)
+
+    def stats(self):
+        """
+        :returns: ordered map of stage to count, total seconds and percentiles of durations as p50, p95 and p99
+        """
+        with self._lock:
+            durations = [(stage, sorted(values)) for stage, values in self._durations.items()]
+        stats = OrderedDict()
+        for stage, values in durations:
+            stage_stats = OrderedDict([('count', len(values)), ('total', sum(values))])
+            for percent in self.percentiles:
+                stage_stats['p%d' % percent] = _percentile(values, percent)
+            stats[stage] = stage_stats
+        return stats
+
+    def report(self):
+        """
+        :returns: table of the stats with durations in milliseconds
+        """
+        lines = ['%-26s %8s %10s %10s %10s %10s' % ('stage', 'count', 'total ms', 'p50 ms', 'p95 ms', 'p99 ms')]
+        for stage, stats in self.stats().items():
+            milliseconds = [stats[key] * 1000 for key in ('total', 'p50', 'p95', 'p99')]
+            lines.append('%-26s %8d %10.1f %10.3f %10.3f %10.3f' % tuple([stage, stats['count']] + milliseconds))
+        return '\n'.join(lines)
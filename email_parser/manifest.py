@@ -0,0 +1,217 @@
+"""
+Build manifest. Keeps hashes of the inputs of every rendered email so the next build can skip emails which didn't
+change.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from functools import lru_cache
+
+from . import config, const, fs, reader
+from .model import *
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+@lru_cache(maxsize=1)
+def _code_fingerprint():
+    digest = hashlib.sha1()
+    package_path = os.path.dirname(os.path.abspath(__file__))
+    for filename in sorted(os.listdir(package_path)):
+        if filename.endswith('.py'):
+            with open(os.path.join(package_path, filename), 'rb') as fp:
+                digest.update(fp.read())
+    return digest.hexdigest()
+
+
+def fingerprint():
+    """
+    :returns: hash of what affects every rendered email: the parser code and its configuration
+    """
+    settings = json.dumps(config.settings(), sort_keys=True)
+    digest = hashlib.sha1()
+    digest.update(str(MANIFEST_VERSION).encode('utf-8'))
+    digest.update(settings.encode('utf-8'))
+    digest.update(_code_fingerprint().encode('utf-8'))
+    return digest.hexdigest()
+
+
+class InputsHasher(object):
+    """
+    Hashes inputs of emails: the source, the template, styles and globals. Files shared between emails are hashed
+    once.
+    """
+
+    def __init__(self, root_path):
+        self.root_path = os.path.realpath(root_path)
+        self._hashes = {}
+
+    def file_hash(self, path):
+        file_hash = self._hashes.get(path)
+        if file_hash is None:
+            try:
+                with open(path, 'rb') as fp:
+                    file_hash = hashlib.sha1(fp.read()).hexdigest()
+            except FileNotFoundError:
+                file_hash = ''
+            self._hashes[path] = file_hash
+        return file_hash
+
+    def __call__(self, email):
+        """
+        :returns: hash of all inputs of the email or None if they can't be resolved
+        """
+        resources = reader.get_email_resources(self.root_path, email)
+        if resources is None:
+            return None
+        digest = hashlib.sha1()
+        for path in [email.path, resources.source, resources.template, resources.globals] + resources.styles:
+            if path:
+                relative_path = os.path.relpath(os.path.realpath(path), self.root_path)
+                digest.update('{}:{}\n'.format(relative_path, self.file_hash(path)).encode('utf-8'))
+            else:
+                digest.update(b'-\n')
+        return digest.hexdigest()
+
+
+class Manifest(object):
+    def __init__(self, fingerprint, emails=None):
+        """
+        :param fingerprint: see `fingerprint`
+        :param emails: inputs hashes by locale and email name
+        """
+        self.fingerprint = fingerprint
+        self.emails = emails or {}
+
+    @staticmethod
+    def filepath(root_path):
+        return os.path.join(root_path, config.paths.destination, const.MANIFEST_FILENAME)
+
+    @classmethod
+    def load(cls, root_path):
+        """
+        :returns: manifest of the last build or None if there is no usable one
+        """
+        return cls.read(cls.filepath(root_path))
+
+    @classmethod
+    def read(cls, path):
+        try:
+            data = json.loads(fs.read_file(path))
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning('ignoring malformed build manifest %s', path)
+            return None
+        if data.get('version') != MANIFEST_VERSION:
+            return None
+        return cls(data['fingerprint'], data['emails'])
+
+    def save(self, root_path):
+        data = {'version': MANIFEST_VERSION, 'fingerprint': self.fingerprint, 'emails': self.emails}
+        os.makedirs(os.path.join(root_path, config.paths.destination), exist_ok=True)
+        fs.save_file_atomic(json.dumps(data, sort_keys=True, indent=const.JSON_INDENT), self.filepath(root_path))
+
+    def get(self, email):
+        return self.emails.get(email.locale, {}).get(email.name)
+
+    def add(self, email, inputs_hash):
+        self.emails.setdefault(email.locale, {})[email.name] = inputs_hash
+
+    def remove(self, email):
+        locale_emails = self.emails.get(email.locale, {})
+        locale_emails.pop(email.name, None)
+        if not locale_emails:
+            self.emails.pop(email.locale, None)
+
+    def is_fresh(self, root_path, email, inputs_hash):
+        """
+        :returns: True if the email was rendered from the same inputs and its output is still in place
+        """
+        return inputs_hash is not None and self.get(email) == inputs_hash and fs.parsed_email_exists(root_path, email)
+
+    def __iter__(self):
+        """
+        :returns: emails in the manifest, without paths
+        """
+        for locale, names in sorted(self.emails.items()):
+            for name in sorted(names):
+                yield Email(name, locale, None)
+
+
+class Journal(object):
+    """
+    Append only log of emails rendered by a build in progress. A build which is killed leaves the journal behind so
+    the next one can continue where it stopped. Finished builds remove it.
+    """
+
+    def __init__(self, root_path):
+        self.root_path = root_path
+        self._fp = None
+
+    @staticmethod
+    def filepath(root_path):
+        return os.path.join(root_path, config.paths.destination, const.JOURNAL_FILENAME)
+
+    def _write(self, entry):
+        self._fp.write(json.dumps(entry, sort_keys=True) + '\n')
+
+    def start(self, build_manifest):
+        """
+        Starts a new journal with emails which are already done.
+
+        :param build_manifest: manifest with emails which don't have to be rendered
+        """
+        os.makedirs(os.path.join(self.root_path, config.paths.destination), exist_ok=True)
+        self._fp = open(self.filepath(self.root_path), 'w')
+        self._write({'version': MANIFEST_VERSION, 'fingerprint': build_manifest.fingerprint})
+        for email in build_manifest:
+            self._write({'locale': email.locale, 'name': email.name, 'hash': build_manifest.get(email)})
+        self._fp.flush()
+
+    def add(self, email, inputs_hash):
+        """
+        Records a rendered email, its files have to be saved already.
+        """
+        self._write({'locale': email.locale, 'name': email.name, 'hash': inputs_hash})
+        self._fp.flush()
+
+    def finish(self):
+        self._fp.close()
+        fs.delete_file(self.filepath(self.root_path))
+
+    @classmethod
+    def replay(cls, root_path, fingerprint, build_manifest=None):
+        """
+        Adds emails recorded by an interrupted build to a manifest.
+
+        :param fingerprint: see `fingerprint`
+        :param build_manifest: manifest to add the emails to or None for a new one
+        :returns: manifest with the emails or `build_manifest` if there is no journal of a build with the fingerprint
+        """
+        try:
+            lines = fs.read_file(cls.filepath(root_path)).splitlines()
+        except FileNotFoundError:
+            return build_manifest
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            return build_manifest
+        if header.get('version') != MANIFEST_VERSION or header.get('fingerprint') != fingerprint:
+            return build_manifest
+
+        if build_manifest is None or build_manifest.fingerprint != fingerprint:
+            build_manifest = Manifest(fingerprint)
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the build was killed while writing the line
+                continue
+            build_manifest.add(Email(entry['name'], entry['locale'], None), entry['hash'])
+        logger.info('resuming build from %s', cls.filepath(root_path))
+        return build_manifest
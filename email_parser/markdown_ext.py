@@ -44,6 +44,7 @@ class BaseUrlImagePattern(Pattern):
         else:
             self.images_dir = ''
         self.image_pattern = ImagePattern(*args)
+        self.image_re = re.compile("^(.*?)%s(.*?)$" % self.image_pattern.pattern, re.DOTALL | re.UNICODE)
 
     def _is_url(self, text):
         url = text.strip().strip('/').split(' ')[0]
@@ -54,8 +55,7 @@ class BaseUrlImagePattern(Pattern):
             image = m.string
         else:
             image = const.IMAGE_PATTERN.format(m.group(2), self.images_dir, m.group(10).strip('/'))
-        pattern = re.compile("^(.*?)%s(.*?)$" % self.image_pattern.pattern, re.DOTALL | re.UNICODE)
-        match = re.match(pattern, ' ' + image + ' ')
+        match = self.image_re.match(' ' + image + ' ')
         el = self.image_pattern.handleMatch(match)
         # each markdown image should have default style
         el.set('style', self.unescape('max-width: 100%;'))
@@ -19,6 +19,14 @@ class EmailType(Enum):
 
 Email = namedtuple('Email', ['name', 'locale', 'path'])
 Template = namedtuple('Template', ['name', 'styles_names', 'styles', 'content', 'placeholders', 'type'])
+# source is the file placeholders are read from, the email of the default locale if the email itself can't be parsed
+EmailResources = namedtuple('EmailResources', ['template', 'styles', 'globals', 'source'])
+# index is 1 based
+Shard = namedtuple('Shard', ['index', 'count'])
+StageEvent = namedtuple('StageEvent', ['stage', 'seconds', 'name', 'locale', 'variant'])
+# sizes are bytes of the saved subject, text and html, error is a map of exception type, message and traceback, cache
+# is a map of hits and misses of the reader caches while rendering
+RenderResult = namedtuple('RenderResult', ['rendered', 'seconds', 'sizes', 'error', 'cache', 'events'])
 
 
 class MetaPlaceholder:
@@ -1,22 +1,42 @@
-from collections import Counter
-from functools import lru_cache
+from collections import Counter, OrderedDict
+import os
 import re
 import json
 import logging
 
-from . import reader, fs, const
+from . import reader, fs, const, config, scheduler
 
 logger = logging.getLogger(__name__)
 
+# configs of the most recently used repositories, a service may work with many of them
+CONFIG_CACHE_SIZE = 32
+
+_config_cache = fs.FileCache(maxsize=CONFIG_CACHE_SIZE)
+
 
 def _extract_placeholders(text):
     return Counter(m.group(1) for m in re.finditer(r'\{\{(\w+)\}\}', text))
 
 
-@lru_cache(maxsize=None)
+def _config_path(root_path):
+    return os.path.join(root_path, const.REPO_SRC_PATH, const.PLACEHOLDERS_FILENAME)
+
+
 def expected_placeholders_file(root_path):
-    content = fs.read_file(root_path, const.REPO_SRC_PATH, const.PLACEHOLDERS_FILENAME)
-    return json.loads(content)
+    """
+    :returns: placeholders config of the repository, cached until the file changes, e.g. by another process
+    """
+    path = _config_path(root_path)
+    return _config_cache.get(path, [path], lambda: json.loads(fs.read_file(path)))
+
+
+# same interface as functions wrapped by lru_cache
+expected_placeholders_file.cache_clear = _config_cache.clear
+expected_placeholders_file.cache_info = _config_cache.info
+
+
+def invalidate_expected_placeholders(root_path):
+    _config_cache.invalidate(_config_path(root_path))
 
 
 def _email_placeholders(root_path, email):
@@ -25,9 +45,34 @@ def _email_placeholders(root_path, email):
     return _extract_placeholders(content)
 
 
+def _emails_placeholders(emails, root_path, settings):
+    """
+    Extracts placeholders of emails, runs in executors too. Processes which are spawned get the configuration from
+    `settings`.
+    """
+    if config.settings() != settings:
+        config.init(**settings)
+    return [_email_placeholders(root_path, email) for email in emails]
+
+
+def _placeholders_by_email(root_path, emails, executor=None, workers=None):
+    """
+    :returns: map of email to its placeholders, emails are read in the executor if there is one
+    """
+    if executor:
+        settings = config.settings()
+        return dict(scheduler.map_chunks(executor, _emails_placeholders, emails, scheduler.workers_count(workers),
+                                         root_path, settings))
+    return {email: _email_placeholders(root_path, email) for email in emails}
+
+
 def get_email_validation(root_path, email):
     email_placeholders = _email_placeholders(root_path, email)
     expected_placeholders = expected_placeholders_file(root_path).get(email.name, {})
+    return _validation(email_placeholders, expected_placeholders)
+
+
+def _validation(email_placeholders, expected_placeholders):
     missing_placeholders = set(expected_placeholders) - set(email_placeholders)
     extra_placeholders = set(email_placeholders) - set(expected_placeholders)
     diff_number = []
@@ -39,8 +84,8 @@ def get_email_validation(root_path, email):
     valid = not missing_placeholders and not extra_placeholders and not diff_number
     if not valid:
         errors = {
-            'missing': list(missing_placeholders),
-            'extra': list(extra_placeholders),
+            'missing': sorted(missing_placeholders),
+            'extra': sorted(extra_placeholders),
             'diff_number': diff_number
         }
     else:
@@ -49,7 +94,61 @@ def get_email_validation(root_path, email):
     return {'valid': valid, 'errors': errors}
 
 
-def generate_config(root_path):
-    emails = fs.emails(root_path, locale=const.DEFAULT_LOCALE)
-    placeholders = {email.name: _email_placeholders(root_path, email) for email in emails}
-    return placeholders
+def validate_emails(root_path, emails=None, executor=None, workers=None):
+    """
+    Validates placeholders of many emails at once. Emails are read and scanned in the executor, their placeholders
+    are compared with the placeholders config in a single pass.
+
+    :param emails: emails to validate, all emails of all locales by default
+    :param executor: optional `concurrent.futures.Executor` reading the emails in parallel
+    :param workers: number of workers of the executor, defaults to the number of CPUs
+    :returns: ordered map of (email name, locale) to validation as returned by `get_email_validation`
+    """
+    emails = sorted(fs.emails(root_path) if emails is None else emails)
+    placeholders = _placeholders_by_email(root_path, emails, executor, workers)
+    expected = expected_placeholders_file(root_path)
+    return OrderedDict(((email.name, email.locale), _validation(placeholders[email], expected.get(email.name, {})))
+                       for email in emails)
+
+
+def validation_report(validations):
+    """
+    :param validations: as returned by `validate_emails`
+    :returns: report with errors of invalid emails by email name and locale
+    """
+    errors = OrderedDict()
+    for (email_name, locale), validation in validations.items():
+        if not validation['valid']:
+            errors.setdefault(email_name, OrderedDict())[locale] = validation['errors']
+    invalid = sum(len(locales) for locales in errors.values())
+    return OrderedDict([('valid', not errors), ('emails', len(validations)), ('invalid', invalid),
+                        ('errors', errors)])
+
+
+def generate_config(root_path, executor=None, workers=None):
+    """
+    :param executor: optional `concurrent.futures.Executor` reading the emails in parallel
+    :param workers: number of workers of the executor, defaults to the number of CPUs
+    :returns: placeholders of every email of the default locale by email name
+    """
+    emails = list(fs.emails(root_path, locale=const.DEFAULT_LOCALE))
+    placeholders = _placeholders_by_email(root_path, emails, executor, workers)
+    return {email.name: placeholders[email] for email in emails}
+
+
+def update_config(root_path, placeholders_config, email_name):
+    """
+    Updates the entry of a single email, e.g. after it was saved or deleted, instead of generating the whole config.
+    Only the default locale is part of the config.
+
+    :param placeholders_config: config as generated by `generate_config`, updated in place
+    :returns: True if the config changed
+    """
+    email = fs.email(root_path, email_name, const.DEFAULT_LOCALE)
+    if email is None:
+        return placeholders_config.pop(email_name, None) is not None
+    email_placeholders = _email_placeholders(root_path, email)
+    if placeholders_config.get(email_name) == email_placeholders:
+        return False
+    placeholders_config[email_name] = email_placeholders
+    return True
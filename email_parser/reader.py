@@ -2,17 +2,24 @@
 Extracts email information from an email file.
 """
 
+import copy
 import logging
+import os
 import re
 from collections import OrderedDict
+from types import MappingProxyType
 
 from lxml import etree
 
-from . import fs, const, config
+from . import fs, const, config, instrumentation
 from .model import *
 
 logger = logging.getLogger(__name__)
 
+_templates_cache = fs.FileCache()
+_styles_cache = fs.FileCache()
+_globals_cache = fs.FileCache()
+
 
 def parse_placeholder(placeholder_str):
     args = {}
@@ -79,6 +86,33 @@ def _placeholders(tree, prefix=''):
     return result
 
 
+@instrumentation.timed('reader.template')
+def _parse_template(template_path):
+    content = fs.read_file(template_path)
+    placeholders = OrderedDict()
+
+    for m in re.finditer(r'{{(.+?)}}', content):
+        placeholder_def = m.group(1)
+        placeholder_meta = parse_placeholder(placeholder_def)
+        placeholders[placeholder_meta.name] = placeholder_meta
+
+    try:
+        # TODO sad panda, refactor
+        # base_url placeholder is not a content block
+        del placeholders['base_url']
+    except KeyError:
+        pass
+
+    return content, placeholders
+
+
+def read_template(template_path):
+    content, placeholders = _templates_cache.get(template_path, [template_path],
+                                                 lambda: _parse_template(template_path))
+    # callers are free to modify the placeholders, the cached map stays untouched
+    return content, OrderedDict(placeholders)
+
+
 def get_template_parts(root_path, template_filename, template_type):
     content = None
     placeholders = OrderedDict()
@@ -90,38 +124,56 @@ def get_template_parts(root_path, template_filename, template_type):
 
     if template_type:
         template_path = str(fs.get_template_filepath(root_path, template_filename, template_type.value))
-        content = fs.read_file(template_path)
+        content, placeholders = read_template(template_path)
     else:
         logger.warning('FIXME: no email_type set for: %s, trying all types..', template_filename)
         for email_type in EmailType:
             try:
                 template_path = str(fs.get_template_filepath(root_path, template_filename, email_type.value))
-                content = fs.read_file(template_path)
+                content, placeholders = read_template(template_path)
                 break
             except FileNotFoundError:
                 continue
 
-    for m in re.finditer(r'{{(.+?)}}', content):
-        placeholder_def = m.group(1)
-        placeholder_meta = parse_placeholder(placeholder_def)
-        placeholders[placeholder_meta.name] = placeholder_meta
+    return content, placeholders
 
-    try:
-        # TODO sad panda, refactor
-        # base_url placeholder is not a content block
-        del placeholders['base_url']
-    except KeyError:
-        pass
 
-    return content, placeholders
+def _read_inline_style(styles_paths):
+    css = [fs.read_file(path) or ' ' for path in styles_paths]
+    styles = '\n'.join(css)
+    return '<style>%s</style>' % styles
 
 
 def get_inline_style(root_path, styles_names):
     if not len(styles_names):
         return ''
-    css = [fs.read_file(root_path, config.paths.templates, f) or ' ' for f in styles_names]
-    styles = '\n'.join(css)
-    return '<style>%s</style>' % styles
+    styles_paths = tuple(os.path.join(root_path, config.paths.templates, f) for f in styles_names)
+    return _inline_style(styles_paths)
+
+
+def _inline_style(styles_paths):
+    return _styles_cache.get(styles_paths, styles_paths, lambda: _read_inline_style(styles_paths))
+
+
+def invalidate_template(root_path, template_filename, template_type):
+    _templates_cache.invalidate(str(fs.get_template_filepath(root_path, template_filename, template_type.value)))
+
+
+def cache_info():
+    """
+    :returns: hits and misses of the templates and styles caches
+    """
+    return {
+        'templates': _templates_cache.info(),
+        'styles': _styles_cache.info(),
+        'globals': _globals_cache.info()
+    }
+
+
+def clear_cache():
+    _templates_cache.clear()
+    _styles_cache.clear()
+    _globals_cache.clear()
 
 
 def _template(root_path, tree):
@@ -173,6 +225,7 @@ def _read_xml(path):
         return None
 
 
+@instrumentation.timed('reader.xml')
 def _read_xml_from_content(content):
     if not content:
         return None
@@ -237,9 +290,21 @@ def create_email_content(root_path, template_name, styles, placeholders, email_t
     return xml_as_str.decode('utf-8')
 
 
+def _read_global_placeholders(path):
+    globals_xml = _read_xml(path)
+    return MappingProxyType(_placeholders(globals_xml, const.GLOBALS_PLACEHOLDER_PREFIX))
+
+
 def get_global_placeholders(root_path, locale):
-    globals_xml = _read_xml(fs.global_email(root_path, locale).path)
-    return _placeholders(globals_xml, const.GLOBALS_PLACEHOLDER_PREFIX)
+    """
+    :returns: read only map of global placeholders for the locale, shared between calls
+    """
+    path = fs.global_email(root_path, locale).path
+    return _globals_cache.get(path, [path], lambda: _read_global_placeholders(path))
+
+
+def invalidate_global_placeholders(root_path, locale):
+    _globals_cache.invalidate(fs.global_email(root_path, locale).path)
 
 
 def get_inferred_placeholders(meta_placeholders, placeholders):
@@ -260,7 +325,8 @@ def read_from_content(root_path, email_content, locale):
     if not template.name:
         logger.error('no HTML template name defined for given content')
     global_placeholders = get_global_placeholders(root_path, locale)
-    placeholders = OrderedDict({name: content for name, content
+    # globals are shared between emails, copy them as inference modifies placeholders in place
+    placeholders = OrderedDict({name: copy.copy(content) for name, content
                                 in global_placeholders.items()
                                 if name in template.placeholders})
     placeholders.update(_placeholders(email_xml).items())
@@ -287,6 +353,86 @@ def read(root_path, email):
     return results
 
 
+def _read_root_attributes(path):
+    """
+    :returns: attributes of the root element or None if the file can't be parsed, like `read` does
+    """
+    try:
+        parser = etree.XMLParser(encoding='utf-8')
+        return dict(etree.parse(path, parser=parser).getroot().attrib)
+    except (etree.ParseError, OSError):
+        return None
+
+
+def get_email_resources(root_path, email):
+    """
+    Resolves files an email is rendered from. Emails which can't be parsed are rendered from the email of the default
+    locale, like `read` does.
+
+    :param root_path: root path of repository
+    :param email: instance of Email namedtuple
+    :returns: EmailResources with paths of the template, styles, globals and source or None if the email can't be read
+    """
+    source = email.path
+    attributes = _read_root_attributes(source)
+    if attributes is None and email.locale != const.DEFAULT_LOCALE:
+        default_email = fs.email(root_path, email.name, const.DEFAULT_LOCALE)
+        if default_email:
+            source = default_email.path
+            attributes = _read_root_attributes(source)
+    if attributes is None:
+        return None
+
+    template_path = None
+    template_filename = attributes.get('template')
+    if template_filename:
+        try:
+            template_types = [EmailType(attributes.get('email_type'))]
+        except ValueError:
+            template_types = list(EmailType)
+        for template_type in template_types:
+            path = str(fs.get_template_filepath(root_path, template_filename, template_type.value))
+            if os.path.isfile(path):
+                template_path = path
+                break
+
+    styles_paths = []
+    if attributes.get('style'):
+        styles_paths = [os.path.join(root_path, config.paths.templates, f) for f in attributes['style'].split(',')]
+
+    return EmailResources(template_path, styles_paths, fs.global_email(root_path, email.locale).path, source)
+
+
+def preload(root_path, emails):
+    """
+    Reads templates, styles and global placeholders the emails are rendered from into the caches. Emails which can't
+    be read are skipped, rendering reports their errors.
+
+    :param root_path: root path of repository
+    :param emails: instances of Email namedtuple
+    :returns: tuple of sets of template contents and inline styles of the emails
+    """
+    contents = set()
+    styles = set()
+    globals_paths = set()
+    for email in emails:
+        resources = get_email_resources(root_path, email)
+        if resources is None:
+            continue
+        try:
+            if resources.template:
+                content, _ = read_template(resources.template)
+                contents.add(content)
+            if resources.styles:
+                styles.add(_inline_style(tuple(resources.styles)))
+            if resources.globals not in globals_paths and os.path.isfile(resources.globals):
+                get_global_placeholders(root_path, email.locale)
+                globals_paths.add(resources.globals)
+        except Exception as e:
+            logger.debug('cannot preload resources of %s: %s', email.path, e)
+    return contents, styles
+
+
 def get_email_type(root_path, email):
     email_content = fs.read_file(email.path)
     email_xml = _read_xml_from_content(email_content)
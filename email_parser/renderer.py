@@ -4,25 +4,86 @@ Different ways of rendering emails.
 
 import logging
 import re
+import threading
 import xml.etree.ElementTree as ET
+from functools import lru_cache
 
 import bs4
-import inlinestyler.utils as inline_styler
 import markdown
 import pystache
+from pystache.parser import _EscapeNode, _LiteralNode
 
-from . import markdown_ext, const, utils, config
+from . import markdown_ext, const, utils, config, inliner, instrumentation
 from .model import *
 from .reader import parse_placeholder
 
 logger = logging.getLogger(__name__)
 
 
+class _MarkdownPool(threading.local):
+    """
+    Markdown instances configured with our extensions, one per base url and thread.
+    """
+
+    def __init__(self):
+        self.engines = {}
+
+    def get(self, base_url=None):
+        base_url = base_url or None
+        engine = self.engines.get(base_url)
+        if engine is None:
+            extensions = [markdown_ext.inline_text(), markdown_ext.no_tracking()]
+            if base_url:
+                extensions.append(markdown_ext.base_url(base_url))
+            engine = markdown.Markdown(extensions=extensions)
+            self.engines[base_url] = engine
+        return engine
+
+
+_markdown_pool = _MarkdownPool()
+
+
+@instrumentation.timed('renderer.markdown')
 def _md_to_html(text, base_url=None):
-    extensions = [markdown_ext.inline_text(), markdown_ext.no_tracking()]
-    if base_url:
-        extensions.append(markdown_ext.base_url(base_url))
-    return markdown.markdown(text, extensions=extensions)
+    engine = _markdown_pool.get(base_url)
+    try:
+        return engine.convert(text)
+    finally:
+        # references, stashed html etc. must not leak into the next conversion
+        engine.reset()
+
+
+class SharedMarkdown(object):
+    """
+    Markdown conversions shared by the renderers of an email or of a batch of emails, every distinct content is
+    converted once.
+    Images don't show up in text emails so the text renderer can use html rendered with the images base url.
+    """
+
+    def __init__(self, base_url=None):
+        self.base_url = base_url
+        self._converted = {}
+        self._rendered = {}
+
+    def __call__(self, text):
+        html = self._converted.get(text)
+        if html is None:
+            html = _md_to_html(text, self.base_url)
+            self._converted[text] = html
+        return html
+
+    def memoize(self, key, render):
+        """
+        Placeholders which don't differ between variants are rendered once for all of them.
+
+        :param key: hashable description of everything the result depends on
+        :param render: function rendering the result
+        """
+        result = self._rendered.get(key)
+        if result is None:
+            result = render()
+            self._rendered[key] = result
+        return result
 
 
 def _split_subject(placeholders):
@@ -35,19 +96,92 @@ def _transform_extended_tags(content):
     return re.sub(regex, lambda match: '{{%s}}' % match.group(2), content)
 
 
+class RenderPlan(object):
+    """
+    Mustache template compiled into literal segments and placeholder slots. Templates using more than plain variables
+    (sections, partials, dotted names...) are rendered with pystache from the parsed template instead.
+    """
+
+    def __init__(self, content):
+        # since pystache tags parsing cant be easily extended: transform all tags extended with types to names only
+        parsed = pystache.parse(_transform_extended_tags(content))
+        self.segments = []
+        self.slots = []
+        self._parsed = None
+        for node in parsed._parse_tree:
+            if isinstance(node, str):
+                self.segments.append(node)
+            elif type(node) in (_EscapeNode, _LiteralNode) and '.' not in node.key:
+                self.slots.append((len(self.segments), node.key))
+                self.segments.append(None)
+            else:
+                self._parsed = parsed
+                break
+
+    def render(self, values):
+        """
+        :raises pystache.context.KeyNotFoundError: on placeholders missing from values
+        """
+        if self._parsed is not None:
+            # pystache escapes html by default, we pass escape option to disable this
+            renderer = pystache.Renderer(escape=lambda u: u, missing_tags='strict')
+            return renderer.render(self._parsed, values)
+        segments = list(self.segments)
+        for idx, key in self.slots:
+            try:
+                value = values[key]
+            except KeyError:
+                raise pystache.context.KeyNotFoundError(key, 'first part')
+            segments[idx] = value if isinstance(value, str) else str(value)
+        return ''.join(segments)
+
+
+@lru_cache(maxsize=128)
+def compile_template(content):
+    return RenderPlan(content)
+
+
+def preload(contents, styles):
+    """
+    Compiles templates and stylesheets ahead of rendering.
+
+    :param contents: template contents
+    :param styles: inline styles as returned by `reader.get_inline_style`
+    """
+    for content in contents:
+        compile_template(content)
+    for css in styles:
+        inliner.compile_stylesheet(css or ' ')
+
+
 class HtmlRenderer(object):
     """
     Renders email' body as html.
     """
 
-    def __init__(self, template, email_locale):
+    def __init__(self, template, email_locale, shared_markdown=None):
         self.template = template
         self.locale = utils.normalize_locale(email_locale)
+        self.shared_markdown = shared_markdown
+
+    def _md_to_html(self, content):
+        if self.shared_markdown:
+            return self.shared_markdown(content)
+        return _md_to_html(content, config.base_img_path)
 
+    def _render_markdown(self, content):
+        def render():
+            return self._inline_css(self._md_to_html(content), self.template.styles)
+
+        if self.shared_markdown:
+            return self.shared_markdown.memoize(('html', content, self.template.styles), render)
+        return render()
+
+    @instrumentation.timed('renderer.inline_css')
     def _inline_css(self, html, css):
         # an empty style will cause an error in inline_styler so we use a space instead
         css = css or ' '
-        html_with_css = inline_styler.inline_css(css + html)
+        html_with_css = inliner.inline_css(css, html)
 
         # inline_styler will return a complete html filling missing html and body tags which we don't want
         if html.startswith('<'):
@@ -61,6 +195,7 @@ class HtmlRenderer(object):
 
         return body.strip()
 
+    @instrumentation.timed('renderer.text_direction')
     def _wrap_with_text_direction(self, html):
         if self.locale in config.rtl_locales:
             soup = bs4.BeautifulSoup(html, 'html.parser')
@@ -91,21 +226,17 @@ class HtmlRenderer(object):
         if placeholder.type == PlaceholderType.raw:
             return content
         else:
-            html = _md_to_html(content, config.base_img_path)
-            html = self._inline_css(html, self.template.styles)
+            html = self._render_markdown(content)
             if highlight and highlight.get('placeholder') == placeholder.name and highlight.get('variant') == variant:
                 html = self._wrap_with_highlight(html, highlight)
             return html
 
+    @instrumentation.timed('renderer.template')
     def _concat_parts(self, subject, parts, variant):
         subject = subject.get_content(variant) if subject is not None else ''
         placeholders = dict(parts.items() | {'subject': subject, 'base_url': config.base_img_path}.items())
         try:
-            # pystache escapes html by default, we pass escape option to disable this
-            renderer = pystache.Renderer(escape=lambda u: u, missing_tags='strict')
-            # since pystache tags parsing cant be easily extended: transform all tags extended with types to names only
-            content = _transform_extended_tags(self.template.content)
-            return renderer.render(content, placeholders)
+            return compile_template(self.template.content).render(placeholders)
         except pystache.context.KeyNotFoundError as e:
             message = 'template %s for locale %s has missing placeholders: %s' % (self.template.name, self.locale, e)
             raise MissingTemplatePlaceholderError(message) from e
@@ -123,11 +254,13 @@ class TextRenderer(object):
     Renders email's body as text.
     """
 
-    def __init__(self, template, email_locale):
+    def __init__(self, template, email_locale, shared_markdown=None):
         # self.shortener = link_shortener.shortener(settings.shortener)
         self.template = template
         self.locale = utils.normalize_locale(email_locale)
+        self.shared_markdown = shared_markdown
 
+    @instrumentation.timed('renderer.html_to_text')
     def _html_to_text(self, html):
         soup = bs4.BeautifulSoup(html, const.HTML_PARSER)
 
@@ -156,8 +289,9 @@ class TextRenderer(object):
         return soup.get_text()
 
     def _md_to_text(self, text, base_url=None):
-        html = _md_to_html(text, base_url)
-        return self._html_to_text(html)
+        if self.shared_markdown:
+            return self.shared_markdown.memoize(('text', text), lambda: self._html_to_text(self.shared_markdown(text)))
+        return self._html_to_text(_md_to_html(text, base_url))
 
     def render(self, placeholders, variant=None):
         _, contents = _split_subject(placeholders)
@@ -179,14 +313,17 @@ class SubjectRenderer(object):
         return subject.get_content(variant)
 
 
-def render(email_locale, template, placeholders, variant=None, highlight=None):
+def render(email_locale, template, placeholders, variant=None, highlight=None, shared_markdown=None):
     subject_renderer = SubjectRenderer()
     subject = subject_renderer.render(placeholders, variant)
 
-    text_renderer = TextRenderer(template, email_locale)
+    # markdown is the most expensive step, convert each placeholder once for both text and html
+    shared_markdown = shared_markdown or SharedMarkdown(config.base_img_path)
+
+    text_renderer = TextRenderer(template, email_locale, shared_markdown)
     text = text_renderer.render(placeholders, variant)
 
-    html_renderer = HtmlRenderer(template, email_locale)
+    html_renderer = HtmlRenderer(template, email_locale, shared_markdown)
     try:
         html = html_renderer.render(placeholders, variant, highlight)
     except MissingTemplatePlaceholderError as e:
@@ -194,3 +331,17 @@ def render(email_locale, template, placeholders, variant=None, highlight=None):
         raise RenderingError(message) from e
 
     return subject, text, html
+
+
+def render_variants(email_locale, template, placeholders, variants):
+    """
+    Renders variants of an email. Placeholders which are the same in all variants are rendered once.
+
+    :returns: list of (subject, text, html) tuples, one per variant
+    """
+    shared_markdown = SharedMarkdown(config.base_img_path)
+    results = []
+    for variant in variants:
+        with instrumentation.context(variant=variant):
+            results.append(render(email_locale, template, placeholders, variant, shared_markdown=shared_markdown))
+    return results
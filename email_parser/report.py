@@ -0,0 +1,88 @@
+"""
+Machine readable report of a build: what happened to every email, how long rendering it took, how big its output is,
+how often it was served from the reader caches and why it failed, plus totals of the whole build. Emails which are up
+to date with the last build are skipped rather than rendered.
+"""
+
+import json
+import os
+import time
+from collections import OrderedDict
+
+from . import const, fs
+from .model import *
+
+REPORT_VERSION = 1
+
+RENDERED = 'rendered'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+REMOVED = 'removed'
+
+
+class BuildReport(object):
+    def __init__(self, workers):
+        """
+        :param workers: number of worker processes of the build
+        """
+        self.workers = workers
+        self.started = time.time()
+        self.seconds = None
+        self.emails = []
+        self.stages = None
+        self.estimated_saving = None
+        self._start = time.perf_counter()
+
+    def _add(self, email, status, seconds=None, sizes=None, error=None, cache=None):
+        self.emails.append(OrderedDict([('name', email.name), ('locale', email.locale), ('status', status),
+                                        ('seconds', seconds), ('sizes', sizes), ('cache', cache), ('error', error)]))
+
+    def add_result(self, email, result):
+        """
+        :param result: RenderResult of the email
+        """
+        status = RENDERED if result.rendered else FAILED
+        self._add(email, status, result.seconds, result.sizes, result.error, result.cache)
+
+    def add_skipped(self, email):
+        """
+        Records an email which is up to date with the last build and wasn't rendered.
+        """
+        self._add(email, SKIPPED)
+
+    def add_removed(self, email):
+        self._add(email, REMOVED)
+
+    def finish(self, stages=None, estimated_saving=None):
+        """
+        :param stages: durations of rendering stages as returned by `instrumentation.Collector.stats`, if profiled
+        :param estimated_saving: estimated seconds saved by rendering the slowest emails first
+        """
+        self.seconds = time.perf_counter() - self._start
+        self.stages = stages
+        self.estimated_saving = estimated_saving
+
+    def totals(self):
+        counts = OrderedDict((status, 0) for status in (RENDERED, FAILED, SKIPPED, REMOVED))
+        for entry in self.emails:
+            counts[entry['status']] += 1
+        totals = OrderedDict([('emails', len(self.emails))])
+        totals.update(counts)
+        caches = [entry['cache'] for entry in self.emails if entry['cache']]
+        totals['cache_hits'] = sum(cache['hits'] for cache in caches)
+        totals['cache_misses'] = sum(cache['misses'] for cache in caches)
+        totals['render_seconds'] = sum(entry['seconds'] or 0.0 for entry in self.emails)
+        totals['output_bytes'] = sum(sum(entry['sizes'].values()) for entry in self.emails if entry['sizes'])
+        totals['estimated_saving_seconds'] = self.estimated_saving
+        totals['seconds'] = self.seconds
+        return totals
+
+    def as_dict(self):
+        return OrderedDict([('version', REPORT_VERSION), ('started', self.started), ('workers', self.workers),
+                            ('totals', self.totals()), ('stages', self.stages), ('emails', self.emails)])
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fs.save_file_atomic(json.dumps(self.as_dict(), indent=const.JSON_INDENT), path)
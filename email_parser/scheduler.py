@@ -0,0 +1,84 @@
+"""
+Distributes work over an executor in chunks. Only a bounded number of chunks is submitted at a time and results are
+yielded as soon as their chunk completes.
+"""
+
+import concurrent.futures
+import heapq
+import math
+import os
+from itertools import islice
+
+# enough chunks per worker to even out workers finishing at different times
+CHUNKS_PER_WORKER = 4
+MAX_CHUNK_SIZE = 50
+# chunks submitted per worker, one running and one waiting in the executor queue
+PENDING_PER_WORKER = 2
+
+
+def workers_count(workers=None):
+    """
+    :param workers: requested number of workers or None for one per CPU
+    """
+    return max(1, workers or os.cpu_count() or 1)
+
+
+def chunk_size(total, workers):
+    """
+    :param total: number of items to process
+    :param workers: number of workers processing them
+    :returns: number of items sent to a worker in a single task
+    """
+    return max(1, min(MAX_CHUNK_SIZE, math.ceil(total / (workers * CHUNKS_PER_WORKER))))
+
+
+def makespan(costs, workers):
+    """
+    Estimates how long processing items takes when chunks are handed to whichever worker is free first.
+
+    :param costs: processing times of items, in the order they are submitted
+    :param workers: number of workers
+    :returns: time the last worker finishes
+    """
+    size = chunk_size(len(costs), workers)
+    finish_times = [0.0] * workers
+    for start in range(0, len(costs), size):
+        finish_time = heapq.heappop(finish_times)
+        heapq.heappush(finish_times, finish_time + sum(costs[start:start + size]))
+    return max(finish_times)
+
+
+def _chunks(items, size):
+    items = iter(items)
+    chunk = list(islice(items, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(items, size))
+
+
+def map_chunks(executor, fn, items, workers, *args):
+    """
+    Calls `fn(chunk, *args)` in the executor for chunks of items.
+
+    :param executor: executor running the tasks
+    :param fn: picklable function processing a list of items and returning a list of results, one per item
+    :param items: sequence of items to process
+    :param workers: number of workers of the executor
+    :returns: generator of (item, result) in the order of completion
+    """
+    chunks = _chunks(items, chunk_size(len(items), workers))
+    max_pending = workers * PENDING_PER_WORKER
+    pending = {}
+    try:
+        for chunk in chunks:
+            pending[executor.submit(fn, chunk, *args)] = chunk
+            if len(pending) < max_pending:
+                continue
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield from zip(pending.pop(future), future.result())
+        for future in concurrent.futures.as_completed(list(pending)):
+            yield from zip(pending.pop(future), future.result())
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,112 @@
+"""
+Splits builds across machines. Every shard renders a deterministic part of the emails into its own destination
+directory, `merge` combines the directories afterwards.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+
+from . import config, const, fs, manifest, timings
+from .model import *
+
+logger = logging.getLogger(__name__)
+
+
+def _cost(email):
+    # source size is the same on every machine, unlike render timings
+    try:
+        return os.path.getsize(email.path)
+    except OSError:
+        return 0
+
+
+def partition(emails, count):
+    """
+    Splits emails into shards of similar total size. Every machine building the same repository gets the same split.
+
+    :param emails: instances of Email namedtuple
+    :param count: number of shards
+    :returns: list of lists of emails, one per shard
+    """
+    shards = [[] for _ in range(count)]
+    sizes = [0] * count
+    for email in sorted(emails, key=lambda email: (-_cost(email), email.locale, email.name)):
+        idx = min(range(count), key=lambda idx: (sizes[idx], idx))
+        shards[idx].append(email)
+        sizes[idx] += _cost(email)
+    return shards
+
+
+def select(emails, shard):
+    """
+    :param shard: Shard to render
+    :returns: emails of the shard
+    """
+    return partition(emails, shard.count)[shard.index - 1]
+
+
+def _copy(source_path, destination_path):
+    os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+    shutil.copy2(source_path, destination_path)
+
+
+def _swap(merged_path, destination_path):
+    """
+    Replaces the destination directory with the merged one.
+    """
+    os.chmod(merged_path, 0o755)
+    previous_path = merged_path + '.previous'
+    if os.path.exists(destination_path):
+        os.replace(destination_path, previous_path)
+    os.replace(merged_path, destination_path)
+    shutil.rmtree(previous_path, ignore_errors=True)
+
+
+def merge(root_path, shards_paths):
+    """
+    Combines destination directories of shard builds into the destination directory of the repository. Shards are
+    merged into a temporary directory which replaces the destination at the end, so the destination can be one of the
+    shards.
+
+    :param root_path: root path of repository
+    :param shards_paths: destination directories of the shard builds
+    :returns: list of emails which none of the shards rendered
+    """
+    shards = []
+    for shard_path in shards_paths:
+        shard_manifest = manifest.Manifest.read(os.path.join(shard_path, const.MANIFEST_FILENAME))
+        if shard_manifest is None:
+            raise ValueError('no build manifest in %s' % shard_path)
+        if shards and shards[0][1].fingerprint != shard_manifest.fingerprint:
+            raise ValueError('%s was built with different code or configuration than %s' % (shard_path, shards[0][0]))
+        shards.append((shard_path, shard_manifest))
+
+    destination_path = os.path.join(root_path, config.paths.destination)
+    parent_path = os.path.dirname(os.path.abspath(destination_path))
+    os.makedirs(parent_path, exist_ok=True)
+    merged_path = tempfile.mkdtemp(dir=parent_path, prefix='.merge-')
+    merged_manifest = manifest.Manifest(shards[0][1].fingerprint if shards else manifest.fingerprint())
+    merged_timings = timings.Timings()
+    try:
+        for shard_path, shard_manifest in shards:
+            for email in shard_manifest:
+                for path in fs.parsed_email_filepaths(root_path, email):
+                    relative_path = os.path.relpath(path, destination_path)
+                    _copy(os.path.join(shard_path, relative_path), os.path.join(merged_path, relative_path))
+                merged_manifest.add(email, shard_manifest.get(email))
+            shard_timings = timings.Timings.read(os.path.join(shard_path, const.TIMINGS_FILENAME))
+            for locale, durations in shard_timings.durations.items():
+                for name, duration in durations.items():
+                    merged_timings.add(Email(name, locale, None), duration)
+            logger.info('merged %s', shard_path)
+    except BaseException:
+        shutil.rmtree(merged_path, ignore_errors=True)
+        raise
+    _swap(merged_path, destination_path)
+    merged_manifest.save(root_path)
+    merged_timings.save(root_path)
+
+    return [email for email in fs.emails(root_path)
+            if merged_manifest.get(email) is None or not fs.parsed_email_exists(root_path, email)]
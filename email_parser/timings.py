@@ -0,0 +1,90 @@
+"""
+Render timings of emails. Durations recorded during a build are used to render the slowest emails first in the next
+one, so cheap emails fill the gaps at the end instead of leaving workers idle while an expensive one finishes.
+"""
+
+import json
+import logging
+import os
+
+from . import config, const, fs, scheduler
+from .model import *
+
+logger = logging.getLogger(__name__)
+
+TIMINGS_VERSION = 1
+
+
+class Timings(object):
+    def __init__(self, durations=None):
+        """
+        :param durations: render durations in seconds by locale and email name
+        """
+        self.durations = durations or {}
+
+    @staticmethod
+    def filepath(root_path):
+        return os.path.join(root_path, config.paths.destination, const.TIMINGS_FILENAME)
+
+    @classmethod
+    def load(cls, root_path):
+        """
+        :returns: timings of previous builds or empty ones if there are none
+        """
+        return cls.read(cls.filepath(root_path))
+
+    @classmethod
+    def read(cls, path):
+        try:
+            data = json.loads(fs.read_file(path))
+        except FileNotFoundError:
+            return cls()
+        except ValueError:
+            logger.warning('ignoring malformed timings %s', path)
+            return cls()
+        if data.get('version') != TIMINGS_VERSION:
+            return cls()
+        return cls(data['durations'])
+
+    def save(self, root_path):
+        data = {'version': TIMINGS_VERSION, 'durations': self.durations}
+        os.makedirs(os.path.join(root_path, config.paths.destination), exist_ok=True)
+        fs.save_file_atomic(json.dumps(data, sort_keys=True, indent=const.JSON_INDENT), self.filepath(root_path))
+
+    def get(self, email):
+        return self.durations.get(email.locale, {}).get(email.name)
+
+    def add(self, email, duration):
+        self.durations.setdefault(email.locale, {})[email.name] = duration
+
+    def remove(self, email):
+        locale_durations = self.durations.get(email.locale, {})
+        locale_durations.pop(email.name, None)
+        if not locale_durations:
+            self.durations.pop(email.locale, None)
+
+    def costs(self, emails):
+        """
+        :returns: expected render durations of the emails, emails without timings are expected to take the average
+        """
+        known = [duration for names in self.durations.values() for duration in names.values()]
+        default = sum(known) / len(known) if known else 0.0
+        costs = []
+        for email in emails:
+            duration = self.get(email)
+            costs.append(default if duration is None else duration)
+        return costs
+
+    def longest_first(self, emails):
+        """
+        :returns: emails sorted by expected render duration, the slowest first
+        """
+        costs = self.costs(emails)
+        order = sorted(range(len(emails)), key=lambda idx: -costs[idx])
+        return [emails[idx] for idx in order]
+
+    def saving(self, emails, ordered_emails, workers):
+        """
+        :returns: estimated wall clock seconds saved by rendering emails in the given order instead of the original one
+        """
+        return scheduler.makespan(self.costs(emails), workers) - scheduler.makespan(self.costs(ordered_emails), workers)
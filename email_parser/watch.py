@@ -0,0 +1,62 @@
+"""
+Polls the repository for changed files.
+"""
+
+import logging
+import os
+import time
+
+from . import const, fs
+
+logger = logging.getLogger(__name__)
+
+
+class Watcher(object):
+    def __init__(self, paths, interval=const.DEFAULT_WATCH_INTERVAL):
+        """
+        :param paths: directories to watch, recursively
+        :param interval: seconds between polls
+        """
+        self.paths = paths
+        self.interval = interval
+        self._snapshot = self.snapshot()
+
+    def _scan(self, path, files):
+        try:
+            entries = list(os.scandir(path))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.is_dir():
+                self._scan(entry.path, files)
+            else:
+                files[entry.path] = fs.file_stamp(entry.path)
+
+    def snapshot(self):
+        """
+        :returns: (mtime, size) of every watched file by path
+        """
+        files = {}
+        for path in self.paths:
+            self._scan(path, files)
+        return files
+
+    def poll(self):
+        """
+        :returns: sorted paths of files added, removed or modified since the last poll
+        """
+        previous = self._snapshot
+        self._snapshot = self.snapshot()
+        return sorted(path for path in previous.keys() | self._snapshot.keys()
+                      if previous.get(path) != self._snapshot.get(path))
+
+    def __iter__(self):
+        """
+        :returns: never ending generator of changed files lists
+        """
+        while True:
+            time.sleep(self.interval)
+            changed = self.poll()
+            if changed:
+                logger.debug('changed files: %s', changed)
+                yield changed
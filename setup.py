@@ -37,7 +37,7 @@ setup(
     author_email='support@getkeepsafe.com',
     url='https://github.com/KeepSafe/ks-email-parser',
     license='Apache',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     install_requires=install_requires,
     tests_require=tests_require,
     extras_require={
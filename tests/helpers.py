@@ -0,0 +1,41 @@
+"""
+Helpers shared by the tests.
+"""
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from email_parser import config
+
+TESTS_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def copy_repository(root_path):
+    """
+    Copies sources and templates of the test repository.
+
+    :returns: `root_path`
+    """
+    for path in (config.paths.source, config.paths.templates):
+        shutil.copytree(os.path.join(TESTS_PATH, path), os.path.join(root_path, path))
+    return root_path
+
+
+def temporary_repository():
+    """
+    :returns: path of a new temporary directory with a copy of the test repository, the caller removes it
+    """
+    return copy_repository(tempfile.mkdtemp())
+
+
+class RepositoryTestCase(TestCase):
+    """
+    Gives every test its own copy of the test repository in `root_path`, removed after the test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.root_path = temporary_repository()
+        self.addCleanup(shutil.rmtree, self.root_path)
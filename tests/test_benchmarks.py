@@ -0,0 +1,48 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+import email_parser
+from benchmarks import generator, suite
+from email_parser import fs
+
+
+class TestGenerator(TestCase):
+    def setUp(self):
+        self.root_path = tempfile.mkdtemp()
+        self.spec = generator.DEFAULT_SPEC._replace(emails=2, locales=('en', 'ar'), variants=2, placeholder_size=100)
+        self.emails = generator.generate(self.root_path, self.spec)
+
+    def tearDown(self):
+        shutil.rmtree(self.root_path)
+
+    def test_emails(self):
+        self.assertEqual(sorted(self.emails), sorted(fs.emails(self.root_path)))
+
+    def test_emails_render(self):
+        parser = email_parser.Parser(self.root_path)
+        for email in self.emails:
+            variants = parser.render_variants(email.name, email.locale)
+            self.assertEqual([None, 'V0', 'V1'], list(variants))
+            self.assertTrue(all(variants.values()))
+
+    def test_deterministic(self):
+        other_path = tempfile.mkdtemp()
+        try:
+            other_emails = generator.generate(other_path, self.spec)
+            for email, other_email in zip(self.emails, other_emails):
+                self.assertEqual(fs.read_file(email.path), fs.read_file(other_email.path))
+        finally:
+            shutil.rmtree(other_path)
+
+
+class TestSuite(TestCase):
+    def test_run(self):
+        root_path = tempfile.mkdtemp()
+        try:
+            emails = generator.generate(root_path, generator.DEFAULT_SPEC._replace(emails=1, locales=('en', )))
+            results = suite.Suite(root_path, emails, repeat=1).run(['read', 'render'])
+        finally:
+            shutil.rmtree(root_path)
+        self.assertEqual(['reader.read', 'Parser.render'], [result.name for result in results])
+        self.assertTrue(all(result.throughput > 0 for result in results))
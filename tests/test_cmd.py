@@ -1,9 +1,14 @@
+import io
+import json
 import os
-import tempfile
 import shutil
+from contextlib import redirect_stderr, redirect_stdout
 from unittest import TestCase
+from unittest.mock import patch
 
-from email_parser import fs, cmd, config
+from email_parser import Parser, fs, cmd, config, instrumentation, manifest, shards, timings
+from email_parser.model import Shard
+from helpers import RepositoryTestCase, temporary_repository
 
 
 def read_fixture(filename):
@@ -16,10 +21,7 @@ class TestParser(TestCase):
 
     @classmethod
     def setUpClass(cls):
-        cls.root_path = tempfile.mkdtemp()
-        shutil.copytree(os.path.join('./tests', config.paths.source), os.path.join(cls.root_path, config.paths.source))
-        shutil.copytree(
-            os.path.join('./tests', config.paths.templates), os.path.join(cls.root_path, config.paths.templates))
+        cls.root_path = temporary_repository()
         cmd.parse_emails(cls.root_path)
 
     @classmethod
@@ -54,3 +56,222 @@ class TestParser(TestCase):
         expected = fs.read_file(TestParser.root_path, config.paths.destination, 'en', 'fallback.html').strip()
         actual = fs.read_file(TestParser.root_path, config.paths.destination, 'fr', 'fallback.html').strip()
         self.assertEqual(expected, actual)
+
+
+class TestIncrementalBuild(RepositoryTestCase):
+    def setUp(self):
+        super().setUp()
+        cmd.parse_emails(self.root_path, incremental=True)
+
+    def _append(self, *path_parts):
+        with open(os.path.join(self.root_path, *path_parts), 'a') as fp:
+            fp.write('\n')
+
+    def _planned(self):
+        _, to_render, removed = cmd._plan_build(self.root_path, True)
+        return [(e.locale, e.name) for e, _ in to_render], [(e.locale, e.name) for e in removed]
+
+    def test_nothing_changed(self):
+        self.assertEqual(([], []), self._planned())
+
+    def test_email_changed(self):
+        self._append(config.paths.source, 'fr', 'email.xml')
+        self.assertEqual(([('fr', 'email')], []), self._planned())
+
+    def test_global_changed(self):
+        self._append(config.paths.source, 'ar', 'global.xml')
+        self.assertEqual(([('ar', 'email')], []), self._planned())
+
+    def test_default_locale_changed(self):
+        self._append(config.paths.source, 'en', 'fallback.xml')
+        to_render, removed = self._planned()
+        self.assertIn(('en', 'fallback'), to_render)
+        self.assertIn(('fr', 'fallback'), to_render)
+
+    def test_template_changed(self):
+        self._append(config.paths.templates, 'marketing', 'globale_template.html')
+        self.assertEqual(([('en', 'email_globale')], []), self._planned())
+
+    def test_email_removed(self):
+        os.remove(os.path.join(self.root_path, config.paths.source, 'fr', 'email.xml'))
+        self.assertEqual(([], [('fr', 'email')]), self._planned())
+        self.assertFalse(os.path.exists(os.path.join(self.root_path, config.paths.destination, 'fr', 'email.html')))
+
+    def test_shard_keeps_other_shards(self):
+        os.remove(os.path.join(self.root_path, config.paths.source, 'fr', 'email.xml'))
+        build_manifest, to_render, removed = cmd._plan_build(self.root_path, True, Shard(1, 2))
+        self.assertEqual([('fr', 'email')], [(e.locale, e.name) for e in removed])
+        shard_emails = shards.select(list(fs.emails(self.root_path)), Shard(1, 2))
+        self.assertEqual(sorted((e.locale, e.name) for e in shard_emails), sorted(
+            (e.locale, e.name) for e in list(build_manifest) + [email for email, _ in to_render]))
+        for email in shards.select(list(fs.emails(self.root_path)), Shard(2, 2)):
+            self.assertTrue(fs.parsed_email_exists(self.root_path, email))
+
+    def test_missing_output(self):
+        os.remove(os.path.join(self.root_path, config.paths.destination, 'en', 'email.text'))
+        self.assertEqual(([('en', 'email')], []), self._planned())
+
+    def test_report(self):
+        report_path = os.path.join(self.root_path, 'build.json')
+        self._append(config.paths.source, 'fr', 'email.xml')
+        with open(os.path.join(self.root_path, config.paths.source, 'ar', 'email.xml'), 'w') as fp:
+            fp.write('<resources template="missing.html"><string name="subject">Subject</string></resources>')
+        with self.assertLogs(cmd.logger, 'INFO') as logs:
+            self.assertFalse(cmd.parse_emails(self.root_path, incremental=True, workers=1, report_path=report_path))
+        self.assertIn('1 emails built, 1 failed', '\n'.join(logs.output))
+
+        with open(report_path) as fp:
+            build_report = json.load(fp)
+        emails = {(e['locale'], e['name']): e for e in build_report['emails']}
+        self.assertEqual('rendered', emails[('fr', 'email')]['status'])
+        self.assertLess(0, emails[('fr', 'email')]['sizes']['text'])
+        self.assertEqual('failed', emails[('ar', 'email')]['status'])
+        self.assertIn('traceback', emails[('ar', 'email')]['error'])
+        self.assertEqual('skipped', emails[('en', 'email')]['status'])
+        self.assertEqual(1, build_report['totals']['rendered'])
+        self.assertEqual(1, build_report['totals']['failed'])
+        self.assertIsInstance(build_report['totals']['estimated_saving_seconds'], float)
+        self.assertLess(0, emails[('fr', 'email')]['cache']['hits'])
+        self.assertLessEqual(emails[('fr', 'email')]['cache']['hits'], build_report['totals']['cache_hits'])
+
+    def test_timings_recorded(self):
+        render_timings = timings.Timings.load(self.root_path)
+        self.assertIsNotNone(render_timings.get(fs.Email('email', 'en', None)))
+        self.assertIsNone(render_timings.get(fs.Email('global', 'en', None)))
+
+    def _interrupt(self, rendered):
+        """
+        Leaves the destination directory as a full build killed after rendering only the given emails would.
+        """
+        build_manifest = manifest.Manifest.load(self.root_path)
+        os.remove(manifest.Manifest.filepath(self.root_path))
+        journal = manifest.Journal(self.root_path)
+        journal.start(manifest.Manifest(build_manifest.fingerprint))
+        for email in fs.emails(self.root_path):
+            if (email.locale, email.name) in rendered:
+                journal.add(email, build_manifest.get(email))
+            else:
+                fs.delete_parsed_email(self.root_path, email)
+        return journal
+
+    def test_journal_removed(self):
+        self.assertFalse(os.path.exists(manifest.Journal.filepath(self.root_path)))
+
+    def test_resume(self):
+        self._interrupt([('en', 'email'), ('fr', 'email')])
+        _, to_render, _ = cmd._plan_build(self.root_path, False, resume=True)
+        planned = [(e.locale, e.name) for e, _ in to_render]
+        self.assertNotIn(('en', 'email'), planned)
+        self.assertNotIn(('fr', 'email'), planned)
+        self.assertIn(('ar', 'email'), planned)
+
+    def test_resume_ignores_partial_entry(self):
+        journal = self._interrupt([('en', 'email')])
+        journal._fp.write('{"locale": "fr", "na')
+        journal._fp.flush()
+        _, to_render, _ = cmd._plan_build(self.root_path, False, resume=True)
+        planned = [(e.locale, e.name) for e, _ in to_render]
+        self.assertNotIn(('en', 'email'), planned)
+        self.assertIn(('fr', 'email'), planned)
+
+    def test_changed_files(self):
+        changed = [os.path.join(config.paths.templates, 'marketing', 'globale_template.html')]
+        build_manifest, to_render, removed = cmd._plan_changed(self.root_path, changed)
+        self.assertEqual([('en', 'email_globale')], [(e.locale, e.name) for e, _ in to_render])
+        self.assertIsNone(build_manifest.get(to_render[0][0]))
+        self.assertIsNotNone(build_manifest.get(fs.Email('email', 'en', None)))
+
+
+class TestWatch(TestCase):
+    @patch('email_parser.cmd.Watcher')
+    @patch('email_parser.cmd._parse_emails')
+    def test_failing_rebuild_keeps_watching(self, mock_parse, mock_watcher):
+        mock_watcher.return_value = iter([['src/en/email.xml'], ['templates_html/basic_template.html']])
+        mock_parse.side_effect = [True, ValueError('invalid placeholder'), True]
+        self.assertTrue(cmd.watch('.', workers=1))
+        self.assertEqual(3, mock_parse.call_count)
+        self.assertEqual(['templates_html/basic_template.html'], mock_parse.call_args[1]['changed'])
+
+
+class TestValidate(RepositoryTestCase):
+    def setUp(self):
+        super().setUp()
+        Parser(self.root_path).refresh_email_placeholders_config()
+        self.output = os.path.join(self.root_path, 'validation.json')
+
+    def _report(self):
+        with open(self.output) as fp:
+            return json.load(fp)
+
+    def test_valid(self):
+        self.assertTrue(cmd.validate(self.root_path, self.output, workers=2))
+        self.assertEqual({}, self._report()['errors'])
+
+    def test_invalid(self):
+        path = os.path.join(self.root_path, config.paths.source, 'fr', 'placeholder.xml')
+        content = fs.read_file(path).replace('{{placeholder}}', '')
+        fs.save_file(content, path)
+        self.assertFalse(cmd.validate(self.root_path, self.output, workers=2))
+        self.assertEqual(['placeholder'], self._report()['errors']['placeholder']['fr']['missing'])
+
+    def test_stdout_has_only_the_report(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        argv = ['ks-email-parser', '-w', '2', 'validate']
+        try:
+            with patch('sys.argv', argv), patch('os.getcwd', return_value=self.root_path), \
+                    redirect_stdout(stdout), redirect_stderr(stderr), self.assertRaises(SystemExit):
+                cmd.main()
+        finally:
+            for handler in list(cmd.logger.handlers):
+                cmd.logger.removeHandler(handler)
+        self.assertTrue(json.loads(stdout.getvalue())['valid'])
+        self.assertIn('All done', stderr.getvalue())
+
+
+class TestGenerateConfig(RepositoryTestCase):
+    def test_workers_passed(self):
+        with patch('email_parser.placeholder.generate_config', return_value={}) as mock_generate:
+            self.assertTrue(cmd.generate_config(self.root_path, workers=2))
+        self.assertEqual(2, mock_generate.call_args[0][2])
+
+
+class TestWorker(RepositoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.settings = config.settings()
+
+    def tearDown(self):
+        config.init(**self.settings)
+        cmd._workers_settings.clear()
+
+    def test_settings_are_applied(self):
+        settings = dict(self.settings, _base_img_path='http://example.com/img')
+        email = fs.email(self.root_path, 'email', 'en')
+        [result] = cmd._parse_emails_batch([email], self.root_path, settings)
+        self.assertTrue(result.rendered)
+        self.assertLess(0, result.seconds)
+        self.assertLess(0, result.sizes['html'])
+        self.assertIsNone(result.error)
+        self.assertEqual('http://example.com/img', config.base_img_path)
+
+    def test_profile(self):
+        email = fs.email(self.root_path, 'email', 'en')
+        [result] = cmd._parse_emails_batch([email], self.root_path, self.settings, profile=True)
+        stages = set(event.stage for event in result.events)
+        self.assertIn('renderer.markdown', stages)
+        self.assertIn('renderer.inline_css', stages)
+        self.assertEqual({('email', 'en')}, set((event.name, event.locale) for event in result.events))
+        self.assertIs(instrumentation.get_instrument(), instrumentation.set_instrument(None))
+
+    def test_initialized_once(self):
+        email = fs.email(self.root_path, 'email', 'en')
+        with patch('email_parser.cmd.Parser', wraps=Parser) as mock_parser:
+            cmd._parse_emails_batch([email], self.root_path, self.settings)
+            cmd._parse_emails_batch([email], self.root_path, self.settings)
+        self.assertEqual(1, mock_parser.call_count)
+
+    def test_preloads_emails_of_batch(self):
+        email = fs.email(self.root_path, 'email', 'en')
+        with patch('email_parser.cmd.reader.preload', return_value=(set(), set())) as mock_preload:
+            cmd._parse_emails_batch([email], self.root_path, self.settings)
+        mock_preload.assert_called_once_with(self.root_path, [email])
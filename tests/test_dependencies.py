@@ -0,0 +1,70 @@
+import os
+import shutil
+from unittest.mock import patch
+
+from email_parser import dependencies, config, reader
+from helpers import RepositoryTestCase
+
+
+class TestDependencyIndex(RepositoryTestCase):
+    def _names(self, emails):
+        return [(email.locale, email.name) for email in emails]
+
+    def test_emails_using_template(self):
+        index = dependencies.load(self.root_path)
+        actual = index.emails_using_template('globale_template.html')
+        self.assertEqual([('en', 'email_globale')], self._names(actual))
+
+    def test_emails_using_style(self):
+        index = dependencies.load(self.root_path)
+        actual = index.emails_using_style('basic_template.css')
+        self.assertEqual(13, len(actual))
+
+    def test_emails_using_global(self):
+        index = dependencies.load(self.root_path)
+        self.assertEqual([('en', 'email_globale')], self._names(index.emails_using_global('unsubscribe')))
+        self.assertEqual([], index.emails_using_global('global_unsubscribe', 'fr'))
+
+    def test_persisted(self):
+        dependencies.load(self.root_path)
+        self.assertTrue(os.path.exists(dependencies.DependencyIndex.filepath(self.root_path)))
+        with patch('email_parser.dependencies.reader', wraps=reader) as mock_reader:
+            dependencies.load(self.root_path)
+        self.assertFalse(mock_reader.get_email_resources.called)
+
+    def test_affected_by_changed_files(self):
+        actual = dependencies.affected_emails(self.root_path, [
+            os.path.join(config.paths.source, 'en', 'global.xml'),
+            os.path.join(self.root_path, config.paths.source, 'fr', 'email.xml')
+        ])
+        self.assertEqual([('en', 'email_globale'), ('fr', 'email')], self._names(actual))
+
+    def test_affected_by_removed_email(self):
+        dependencies.load(self.root_path)
+        email_path = os.path.join(self.root_path, config.paths.source, 'fr', 'email.xml')
+        os.remove(email_path)
+        actual = dependencies.affected_emails(self.root_path, [email_path])
+        self.assertEqual([('fr', 'email')], self._names(actual))
+
+    def test_malformed_template(self):
+        template_path = os.path.join(config.paths.templates, 'marketing', 'globale_template.html')
+        with open(os.path.join(self.root_path, template_path), 'a') as fp:
+            fp.write('{{bogus:thing:a=1}}')
+        actual = dependencies.affected_emails(self.root_path, [template_path])
+        self.assertEqual([('en', 'email_globale')], self._names(actual))
+
+    def test_affected_by_default_locale_email(self):
+        dependencies.load(self.root_path)
+        actual = dependencies.affected_emails(self.root_path, [os.path.join(config.paths.source, 'en', 'fallback.xml')])
+        self.assertEqual([('en', 'fallback'), ('fr', 'fallback')], self._names(actual))
+
+    def test_emails_using_template_of_type(self):
+        marketing_path = os.path.join(self.root_path, config.paths.templates, 'marketing', 'basic_template.html')
+        shutil.copy(os.path.join(self.root_path, config.paths.templates, 'transactional', 'basic_template.html'),
+                    marketing_path)
+        index = dependencies.load(self.root_path)
+        marketing = self._names(index.emails_using_template('basic_template.html', 'marketing'))
+        transactional = self._names(index.emails_using_template('basic_template.html', 'transactional'))
+        self.assertIn(('en', 'email'), transactional)
+        self.assertNotIn(('en', 'email'), marketing)
+        self.assertFalse(set(marketing) & set(transactional))
@@ -1,5 +1,9 @@
+import os
+import shutil
+import tempfile
 from unittest import TestCase
 from unittest.mock import patch
+
 from email_parser import fs
 from email_parser.model import *
 
@@ -39,35 +43,6 @@ class TestFs(TestCase):
         super().tearDown()
         self.patch_path.stop()
 
-    def test_emails_happy_path(self):
-        expected = Email('name1', 'locale1', 'locale1/name1.xml')
-        self.mock_path.return_value.glob.return_value = [MockPath(expected.path)]
-        actual = list(fs.emails('.'))
-        self.assertEqual([expected], actual)
-
-    def test_emails_correct_size(self):
-        self.mock_path.return_value.glob.return_value = [MockPath('locale1/name1.xml'), MockPath('locale2/name2.xml')]
-        actual = list(fs.emails('.'))
-        self.assertEqual(2, len(actual))
-
-    def test_emails_ignore_dirs(self):
-        self.mock_path.return_value.glob.return_value = [MockPath('locale1/name1.xml'), MockPath('locale1', True)]
-        actual = list(fs.emails('.'))
-        self.assertEqual(1, len(actual))
-
-    def test_emails_ignore_global_by_default(self):
-        self.mock_path.return_value.glob.return_value = [MockPath('locale1/name1.xml'), MockPath('locale1/global.xml')]
-        actual = list(fs.emails('.'))
-        self.assertEqual(1, len(actual))
-
-    def test_email_locale(self):
-        self.mock_path.return_value.glob.return_value = [
-            MockPath('locale1/name1.xml'), MockPath('locale1/name2.xml'), MockPath('locale2/name2.xml')
-        ]
-        actual = fs.email('.', 'name2', 'locale1')
-        self.assertEqual('name2', actual.name)
-        self.assertEqual('locale1', actual.locale)
-
     def test_resources(self):
         template_name = 'name1.html'
         css_name = 'name2.css'
@@ -101,3 +76,119 @@ class TestFs(TestCase):
         expected = 'src/en/email.xml'
         actual = fs.get_email_filepath('email', 'en')
         self.assertEqual(expected, actual)
+
+
+class TestEmailIndex(TestCase):
+    def setUp(self):
+        self.root_path = os.path.realpath(tempfile.mkdtemp())
+        self.source_path = os.path.join(self.root_path, 'src')
+
+    def tearDown(self):
+        shutil.rmtree(self.root_path)
+
+    def _touch(self, *path_parts):
+        path = os.path.join(self.source_path, *path_parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fp:
+            fp.write('<resources/>')
+        return path
+
+    def test_emails_happy_path(self):
+        path = self._touch('locale1', 'name1.xml')
+        actual = list(fs.emails(self.root_path))
+        self.assertEqual([Email('name1', 'locale1', path)], actual)
+
+    def test_emails_correct_size(self):
+        self._touch('locale1', 'name1.xml')
+        self._touch('locale2', 'name2.xml')
+        actual = list(fs.emails(self.root_path))
+        self.assertEqual(2, len(actual))
+
+    def test_emails_ignore_dirs(self):
+        self._touch('locale1', 'name1.xml')
+        os.makedirs(os.path.join(self.source_path, 'locale1', 'name2.xml'))
+        actual = list(fs.emails(self.root_path))
+        self.assertEqual(1, len(actual))
+
+    def test_emails_ignore_global_by_default(self):
+        self._touch('locale1', 'name1.xml')
+        self._touch('locale1', 'global.xml')
+        actual = list(fs.emails(self.root_path))
+        self.assertEqual(1, len(actual))
+
+    def test_email_locale(self):
+        self._touch('locale1', 'name1.xml')
+        self._touch('locale1', 'name2.xml')
+        self._touch('locale2', 'name2.xml')
+        actual = fs.email(self.root_path, 'name2', 'locale1')
+        self.assertEqual('name2', actual.name)
+        self.assertEqual('locale1', actual.locale)
+
+    def test_email_missing(self):
+        self._touch('locale1', 'name1.xml')
+        self.assertIsNone(fs.email(self.root_path, 'name2', 'locale1'))
+
+    def test_sees_added_and_removed_emails(self):
+        path = self._touch('locale1', 'name1.xml')
+        self.assertEqual(1, len(list(fs.emails(self.root_path))))
+        self._touch('locale2', 'name2.xml')
+        os.remove(path)
+        actual = list(fs.emails(self.root_path))
+        self.assertEqual([Email('name2', 'locale2', os.path.join(self.source_path, 'locale2', 'name2.xml'))], actual)
+        self.assertIsNone(fs.email(self.root_path, 'name1', 'locale1'))
+
+    def test_unchanged_directories_are_not_rescanned(self):
+        self._touch('locale1', 'name1.xml')
+        index = fs.EmailIndex(self.source_path, '{locale}/{name}.xml')
+        index.racy_interval_ns = 0
+        index.all()
+        with patch.object(index, '_scan_dir') as mock_scan:
+            index.all()
+            self.assertEqual('name1', index.get('name1', 'locale1').name)
+            mock_scan.assert_not_called()
+
+    def test_clear_indexes(self):
+        self._touch('locale1', 'name1.xml')
+        index = fs.email_index(self.root_path)
+        self.assertIs(index, fs.email_index(self.root_path))
+        fs.clear_indexes()
+        self.assertIsNot(index, fs.email_index(self.root_path))
+
+
+class TestFileCache(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'file.txt')
+        with open(self.path, 'w') as fp:
+            fp.write('first')
+        self.cache = fs.FileCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _load(self):
+        return self.cache.get(self.path, [self.path], lambda: fs.read_file(self.path))
+
+    def test_hit_after_miss(self):
+        self.assertEqual('first', self._load())
+        self.assertEqual('first', self._load())
+        self.assertEqual((1, 1), self.cache.info()[:2])
+
+    def test_reload_on_change(self):
+        self._load()
+        with open(self.path, 'w') as fp:
+            fp.write('second version')
+        self.assertEqual('second version', self._load())
+        self.assertEqual((0, 2), self.cache.info()[:2])
+
+    def test_missing_file_is_not_cached(self):
+        path = os.path.join(self.tmp_dir, 'missing.txt')
+        self.cache.get(path, [path], lambda: 'value')
+        self.cache.get(path, [path], lambda: 'value')
+        self.assertEqual(fs.CacheInfo(0, 2, None, 0), self.cache.info())
+
+    def test_maxsize(self):
+        cache = fs.FileCache(maxsize=1)
+        cache.get('a', [self.path], lambda: 'a')
+        cache.get('b', [self.path], lambda: 'b')
+        self.assertEqual(1, cache.info().currsize)
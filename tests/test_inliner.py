@@ -0,0 +1,33 @@
+from unittest import TestCase
+
+import inlinestyler.utils as inline_styler
+
+from email_parser import inliner
+
+
+class TestInliner(TestCase):
+    def setUp(self):
+        self.css = '<style>p {color:red;} p a {color:blue !important; font-weight:bold} #id {color:green}</style>'
+
+    def _assert_same_as_inlinestyler(self, html):
+        expected = inline_styler.inline_css(self.css + html)
+        actual = inliner.inline_css(self.css, html)
+        self.assertEqual(expected, actual)
+
+    def test_happy_path(self):
+        self._assert_same_as_inlinestyler('<p>text</p>')
+
+    def test_specificity(self):
+        self._assert_same_as_inlinestyler('<p id="id">text <a href="http://link.com">link</a></p>')
+
+    def test_existing_inline_style(self):
+        self._assert_same_as_inlinestyler('<p style="color: yellow; margin: 0">text</p>')
+
+    def test_plain_text(self):
+        self._assert_same_as_inlinestyler('text')
+
+    def test_fragment_styles(self):
+        self._assert_same_as_inlinestyler('<style>p {margin: 0}</style><p>text</p>')
+
+    def test_stylesheet_compiled_once(self):
+        self.assertIs(inliner.compile_stylesheet(self.css), inliner.compile_stylesheet(self.css))
@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+import email_parser
+from email_parser import instrumentation
+from email_parser.model import *
+
+
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        self.parser = email_parser.Parser('./tests')
+        self.recorder = instrumentation.Recorder()
+
+    def test_default_instrument_records_nothing(self):
+        self.parser.render('email', 'en')
+        self.assertIs(instrumentation.get_instrument(), instrumentation.set_instrument(None))
+
+    def test_events(self):
+        with instrumentation.installed(self.recorder):
+            self.parser.render('email', 'en', 'B')
+        events = self.recorder.flush()
+        expected_stages = {'fs.email', 'reader.xml', 'renderer.markdown', 'renderer.inline_css', 'renderer.template',
+                           'renderer.text_direction', 'renderer.html_to_text'}
+        self.assertTrue(expected_stages <= set(event.stage for event in events))
+        self.assertEqual({('email', 'en', 'B')}, set((event.name, event.locale, event.variant) for event in events))
+        self.assertEqual([], self.recorder.flush())
+
+    def test_variants_context(self):
+        with instrumentation.installed(self.recorder):
+            self.parser.render_variants('email', 'en')
+        variants = set(event.variant for event in self.recorder.flush() if event.stage == 'renderer.template')
+        self.assertEqual({None, 'B'}, variants)
+
+    def test_context_is_restored(self):
+        with instrumentation.installed(self.recorder):
+            with instrumentation.context(name='outer', locale='en'):
+                with instrumentation.context(variant='B'):
+                    self.parser.render_email(None)
+                instrumentation.timed('stage')(lambda: None)()
+        self.assertEqual([StageEvent('stage', self.recorder.events[0].seconds, 'outer', 'en', None)],
+                         self.recorder.events)
+
+
+class TestCollector(TestCase):
+    def test_stats(self):
+        collector = instrumentation.Collector()
+        for idx in range(1, 101):
+            collector.event(StageEvent('stage', idx / 1000.0, 'email', 'en', None))
+        stats = collector.stats()['stage']
+        self.assertEqual(100, stats['count'])
+        self.assertEqual((0.05, 0.095, 0.099), (stats['p50'], stats['p95'], stats['p99']))
+        self.assertIn('stage', collector.report())
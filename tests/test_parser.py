@@ -1,10 +1,14 @@
+import concurrent.futures
+import json
 import os
+import threading
 from unittest import TestCase
 from unittest.mock import patch
 
 import email_parser
 from email_parser import config
 from email_parser.model import EmailType
+from helpers import RepositoryTestCase
 
 
 def read_fixture(filename):
@@ -36,6 +40,37 @@ class TestParser(TestCase):
         self.assertEqual(html, read_fixture('email.b.html'))
         self.assertEqual(text, read_fixture('email.b.text').strip())
 
+    def test_render_many(self):
+        requests = [('email', 'en', 'B'), ('placeholder', 'en'), ('missing', 'en'), ('email', 'en'), ('email', 'en')]
+        expected = [self.parser.render(*request) for request in requests]
+        self.assertEqual(expected, self.parser.render_many(requests))
+
+    def test_render_many_reads_email_once(self):
+        with patch('email_parser.reader.read', wraps=email_parser.reader.read) as mock_read:
+            self.parser.render_many([('email', 'en'), ('email', 'en', 'B'), ('email', 'fr')])
+        self.assertEqual(2, mock_read.call_count)
+
+    def test_render_many_executor(self):
+        requests = [('email', 'en'), ('email', 'en', 'B'), ('email_globale', 'en')]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            actual = self.parser.render_many(requests, executor)
+        self.assertEqual(self.parser.render_many(requests), actual)
+
+    def test_render_variants(self):
+        actual = self.parser.render_variants('email', 'en')
+        self.assertEqual([None, 'B'], list(actual))
+        self.assertEqual(self.parser.render('email', 'en'), actual[None])
+        self.assertEqual(self.parser.render('email', 'en', 'B'), actual['B'])
+
+    def test_render_variants_renders_shared_placeholders_once(self):
+        with patch('email_parser.renderer.inliner.inline_css', wraps=email_parser.renderer.inliner.inline_css) as mock:
+            self.parser.render_variants('email', 'en')
+        # color, image and image_absolute once, content once per variant
+        self.assertEqual(5, mock.call_count)
+
+    def test_render_variants_missing_email(self):
+        self.assertIsNone(self.parser.render_variants('missing', 'en'))
+
     def test_get_email_names(self):
         names = self.parser.get_email_names()
         self.assertListEqual(
@@ -218,6 +253,13 @@ class TestParser(TestCase):
         content, _ = mock_save.call_args[0]
         self.assertMultiLineEqual(content.strip(), expected.strip())
 
+    @patch('email_parser.fs.save_email')
+    @patch('email_parser.reader.invalidate_global_placeholders')
+    def test_save_global_invalidates_cache(self, mock_invalidate, mock_save):
+        with patch.object(self.parser, 'refresh_email_placeholders_config'):
+            self.parser.save_email('global', 'fr', '<resources/>')
+        mock_invalidate.assert_called_once_with('./tests', 'fr')
+
     def test_original(self):
         actual = self.parser.original('email_order', 'en')
         self.assertEqual(actual, read_fixture('original.txt').strip())
@@ -231,3 +273,142 @@ class TestParser(TestCase):
     def test_parse_email_with_inference(self):
         subject, text, html = self.parser.render('email_render_with_inference', 'en')
         self.assertEqual(html, read_fixture('email_render_with_inference.html'))
+
+
+class TestParserDependencies(RepositoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.parser = email_parser.Parser(self.root_path)
+
+    def test_get_emails_affected_by(self):
+        actual = self.parser.get_emails_affected_by(['templates_html/marketing/globale_template.html'])
+        self.assertEqual(['email_globale'], [email['name'] for email in actual])
+
+    def test_get_emails_using_template(self):
+        actual = self.parser.get_emails_using_template('email_render_with_inference.html')
+        self.assertEqual([('email_render_with_inference', 'en')], [(e['name'], e['locale']) for e in actual])
+
+
+class TestPlaceholdersConfig(RepositoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.parser = email_parser.Parser(self.root_path)
+        self.parser.refresh_email_placeholders_config()
+
+    def tearDown(self):
+        email_parser.placeholder.expected_placeholders_file.cache_clear()
+
+    def _config(self):
+        with open(self.parser.get_placeholders_filepath()) as fp:
+            return json.load(fp)
+
+    def test_save_updates_email(self):
+        content = self.parser.get_email('email', 'en').replace('Dummy content', 'Dummy {{content_link}}')
+        with patch('email_parser.placeholder.generate_config') as mock_generate:
+            self.parser.save_email('email', 'en', content)
+        mock_generate.assert_not_called()
+        self.assertEqual({'content_link': 1}, self._config()['email'])
+        self.assertEqual(['content_link'], self.parser.get_email_placeholders()['email'])
+        self.assertEqual({'placeholder': 1}, self._config()['placeholder'])
+
+    def test_save_other_locale(self):
+        content = self.parser.get_email('email', 'fr').replace('Dummy content', 'Dummy {{content_link}}')
+        before = os.stat(self.parser.get_placeholders_filepath()).st_mtime_ns
+        self.parser.save_email('email', 'fr', content)
+        self.assertEqual(before, os.stat(self.parser.get_placeholders_filepath()).st_mtime_ns)
+
+    def test_delete_removes_email(self):
+        self.parser.delete_email('placeholder')
+        self.assertNotIn('placeholder', self._config())
+        self.assertIn('missing_placeholder', self._config())
+
+    def test_missing_config_generated(self):
+        os.remove(self.parser.get_placeholders_filepath())
+        email_parser.placeholder.expected_placeholders_file.cache_clear()
+        self.parser.delete_email('placeholder')
+        self.assertEqual({'placeholder': 1}, self._config()['missing_placeholder'])
+
+
+class TestBatch(RepositoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.parser = email_parser.Parser(self.root_path)
+        self.parser.refresh_email_placeholders_config()
+        self.content = self.parser.get_email('email', 'en').replace('Dummy content', 'Dummy {{content_link}}')
+
+    def tearDown(self):
+        email_parser.placeholder.expected_placeholders_file.cache_clear()
+
+    def test_writes_on_exit(self):
+        with patch('email_parser.placeholder.update_config', return_value=True) as mock_update:
+            with self.parser.batch():
+                path = self.parser.save_email('email', 'en', self.content)
+                self.parser.save_email('email_order', 'en', self.content)
+                self.assertNotIn('content_link', email_parser.fs.read_file(path))
+                mock_update.assert_not_called()
+        self.assertIn('content_link', email_parser.fs.read_file(path))
+        self.assertEqual(['email', 'email_order'], [args[2] for args, _ in mock_update.call_args_list])
+
+    def test_config_updated_once(self):
+        with patch.object(self.parser, '_save_placeholders_config') as mock_save:
+            with self.parser.batch():
+                for locale in ('en', 'fr', 'ar'):
+                    self.parser.save_email('email', locale, self.content)
+                self.parser.save_email('email_order', 'en', self.content)
+        self.assertEqual(1, mock_save.call_count)
+        placeholders_config = mock_save.call_args[0][0]
+        self.assertEqual({'content_link': 1}, placeholders_config['email'])
+        self.assertEqual({'content_link': 1}, placeholders_config['email_order'])
+
+    def test_delete(self):
+        with self.parser.batch():
+            self.parser.save_email('email', 'de', self.content)
+            files = self.parser.delete_email('email')
+        self.assertIn(email_parser.fs.email_path(self.root_path, 'email', 'de'), files)
+        self.assertEqual([], list(email_parser.fs.emails(self.root_path, 'email')))
+        self.assertNotIn('email', self.parser.get_email_placeholders())
+
+    def test_discarded_on_error(self):
+        path = email_parser.fs.email_path(self.root_path, 'email', 'en')
+        with self.assertRaises(RuntimeError):
+            with self.parser.batch():
+                self.parser.save_email('email', 'en', self.content)
+                raise RuntimeError()
+        self.assertNotIn('content_link', email_parser.fs.read_file(path))
+        self.assertIsNone(self.parser._batch)
+
+    def test_other_threads_not_buffered(self):
+        with self.parser.batch():
+            thread = threading.Thread(target=self.parser.save_email, args=('email_order', 'en', self.content))
+            thread.start()
+            thread.join()
+            path = email_parser.fs.email_path(self.root_path, 'email_order', 'en')
+            self.assertIn('content_link', email_parser.fs.read_file(path))
+            self.assertEqual({}, self.parser._batch)
+
+    def test_nothing_written_if_write_fails(self):
+        path = email_parser.fs.email_path(self.root_path, 'email', 'en')
+        staged = email_parser.fs.save_temporary_file(self.content, path)
+        with patch('email_parser.fs.save_temporary_file', side_effect=[staged, OSError()]):
+            with self.assertRaises(OSError):
+                with self.parser.batch():
+                    self.parser.save_email('email', 'en', self.content)
+                    self.parser.save_email('email_order', 'en', self.content)
+        self.assertNotIn('content_link', email_parser.fs.read_file(path))
+        self.assertEqual([], [f for f in os.listdir(os.path.dirname(path)) if f.endswith('.tmp')])
+
+    def test_config_updated_if_replace_fails(self):
+        replace = os.replace
+
+        def fail_email_order(source, destination):
+            if destination.endswith('email_order.xml'):
+                raise OSError()
+            replace(source, destination)
+
+        with patch('os.replace', side_effect=fail_email_order):
+            with self.assertRaises(OSError):
+                with self.parser.batch():
+                    self.parser.save_email('email', 'en', self.content)
+                    self.parser.save_email('email_order', 'en', self.content)
+        with open(self.parser.get_placeholders_filepath()) as fp:
+            self.assertEqual({'content_link': 1}, json.load(fp)['email'])
@@ -1,3 +1,8 @@
+import concurrent.futures
+import json
+import os
+import shutil
+import tempfile
 from unittest import TestCase
 from unittest.mock import patch
 from collections import Counter
@@ -33,6 +38,79 @@ class TestGenerator(TestCase):
         config = placeholder.generate_config('.')
         self.assertEqual(config, {})
 
+    def test_update_email(self):
+        self.mock_fs.email.return_value = Email('test_name', 'en', 'path')
+        self.mock_reader.read.return_value = ('', {'segment': Placeholder('segment', '{{placeholder}}')})
+        config = {'test_name': {'old': 1}, 'other': {'placeholder': 2}}
+        self.assertTrue(placeholder.update_config('.', config, 'test_name'))
+        self.assertEqual(config, {'test_name': Counter({'placeholder': 1}), 'other': {'placeholder': 2}})
+        self.assertFalse(placeholder.update_config('.', config, 'test_name'))
+
+    def test_update_deleted_email(self):
+        self.mock_fs.email.return_value = None
+        config = {'test_name': {'placeholder': 1}}
+        self.assertTrue(placeholder.update_config('.', config, 'test_name'))
+        self.assertEqual(config, {})
+        self.mock_reader.read.assert_not_called()
+
+
+class TestParallelGenerator(TestCase):
+    def test_same_as_serial(self):
+        with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+            actual = placeholder.generate_config('tests', executor, workers=2)
+        expected = placeholder.generate_config('tests')
+        self.assertEqual(json.dumps(expected, sort_keys=True), json.dumps(actual, sort_keys=True))
+
+
+class TestExpectedPlaceholders(TestCase):
+    def setUp(self):
+        self.root_paths = []
+        placeholder.expected_placeholders_file.cache_clear()
+
+    def tearDown(self):
+        for root_path in self.root_paths:
+            shutil.rmtree(root_path)
+        placeholder.expected_placeholders_file.cache_clear()
+
+    def _repository(self, placeholders_config):
+        root_path = tempfile.mkdtemp()
+        self.root_paths.append(root_path)
+        os.makedirs(os.path.join(root_path, 'src'))
+        self._save(root_path, placeholders_config)
+        return root_path
+
+    def _save(self, root_path, placeholders_config, mtime=None):
+        path = os.path.join(root_path, 'src', 'placeholders_config.json')
+        with open(path, 'w') as fp:
+            json.dump(placeholders_config, fp)
+        if mtime:
+            os.utime(path, (mtime, mtime))
+
+    def test_cached(self):
+        root_path = self._repository({'email': {'link': 1}})
+        placeholder.expected_placeholders_file(root_path)
+        self.assertEqual({'email': {'link': 1}}, placeholder.expected_placeholders_file(root_path))
+        self.assertEqual((1, 1), placeholder.expected_placeholders_file.cache_info()[:2])
+
+    def test_changed_file_reloaded(self):
+        root_path = self._repository({'email': {'link': 1}})
+        placeholder.expected_placeholders_file(root_path)
+        self._save(root_path, {'email': {'link': 2}}, mtime=1)
+        self.assertEqual({'email': {'link': 2}}, placeholder.expected_placeholders_file(root_path))
+
+    def test_invalidate(self):
+        root_path = self._repository({})
+        placeholder.expected_placeholders_file(root_path)
+        placeholder.invalidate_expected_placeholders(root_path)
+        placeholder.expected_placeholders_file(root_path)
+        self.assertEqual((0, 2), placeholder.expected_placeholders_file.cache_info()[:2])
+
+    @patch('email_parser.placeholder._config_cache', fs.FileCache(maxsize=2))
+    def test_bounded(self):
+        for _ in range(3):
+            placeholder.expected_placeholders_file(self._repository({}))
+        self.assertEqual(2, placeholder._config_cache.info().currsize)
+
 
 class TestValidate(TestCase):
     def setUp(self):
@@ -50,6 +128,7 @@ class TestValidate(TestCase):
     def tearDown(self):
         super().tearDown()
         self.patch_reader.stop()
+        self.patch_config.stop()
 
     def test_happy_path(self):
         actual = placeholder.get_email_validation('.', self.email, )
@@ -81,3 +160,28 @@ class TestValidate(TestCase):
             }
         }
         self.assertEqual(expected, actual)
+
+
+class TestBulkValidation(TestCase):
+    def setUp(self):
+        placeholder.expected_placeholders_file.cache_clear()
+
+    def test_same_as_single_validation(self):
+        validations = placeholder.validate_emails('tests')
+        emails = list(fs.emails('tests'))
+        self.assertEqual(len(emails), len(validations))
+        for email in emails:
+            expected = placeholder.get_email_validation('tests', email)
+            self.assertEqual(expected, validations[(email.name, email.locale)])
+
+    def test_executor(self):
+        with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+            actual = placeholder.validate_emails('tests', executor=executor, workers=2)
+        self.assertEqual(placeholder.validate_emails('tests'), actual)
+
+    def test_report(self):
+        invalid = {'missing': ['link'], 'extra': [], 'diff_number': []}
+        validations = {('email', 'en'): {'valid': True, 'errors': None},
+                       ('email', 'fr'): {'valid': False, 'errors': invalid}}
+        actual = placeholder.validation_report(validations)
+        self.assertEqual({'valid': False, 'emails': 2, 'invalid': 1, 'errors': {'email': {'fr': invalid}}}, actual)
@@ -4,8 +4,9 @@ from unittest.mock import patch
 
 from lxml import etree
 
-from email_parser import reader
+from email_parser import reader, fs
 from email_parser.model import *
+from helpers import RepositoryTestCase
 
 
 def read_fixture(filename, decoder=None):
@@ -193,6 +194,71 @@ class TestWriter(TestCase):
         self.elements_equal(expected_xml, xml_result)
 
 
+class TestCache(RepositoryTestCase):
+    def setUp(self):
+        super().setUp()
+        reader.clear_cache()
+
+    def tearDown(self):
+        reader.clear_cache()
+
+    def test_template_read_once(self):
+        with patch('email_parser.reader.fs.read_file', wraps=reader.fs.read_file) as mock_read:
+            reader.get_template_parts(self.root_path, 'basic_template.html', 'transactional')
+            reader.get_template_parts(self.root_path, 'basic_template.html', 'transactional')
+        self.assertEqual(1, mock_read.call_count)
+        self.assertEqual((1, 1), reader.cache_info()['templates'][:2])
+
+    def test_template_placeholders_are_copied(self):
+        _, placeholders = reader.get_template_parts(self.root_path, 'basic_template.html', 'transactional')
+        placeholders.clear()
+        _, placeholders = reader.get_template_parts(self.root_path, 'basic_template.html', 'transactional')
+        self.assertIn('content', placeholders)
+
+    def test_template_reloaded_on_change(self):
+        reader.get_template_parts(self.root_path, 'basic_template.html', 'transactional')
+        with open(os.path.join(self.root_path, 'templates_html', 'transactional', 'basic_template.html'), 'w') as fp:
+            fp.write('<body>{{changed}}</body>')
+        content, placeholders = reader.get_template_parts(self.root_path, 'basic_template.html', 'transactional')
+        self.assertEqual('<body>{{changed}}</body>', content)
+        self.assertEqual(['changed'], list(placeholders))
+
+    def test_styles_cached(self):
+        reader.get_inline_style(self.root_path, ['basic_template.css'])
+        styles = reader.get_inline_style(self.root_path, ['basic_template.css'])
+        self.assertTrue(styles.startswith('<style>a {'))
+        self.assertEqual((1, 1), reader.cache_info()['styles'][:2])
+
+    def test_globals_cached(self):
+        first = reader.get_global_placeholders(self.root_path, 'en')
+        second = reader.get_global_placeholders(self.root_path, 'en')
+        self.assertIs(first, second)
+        self.assertEqual((1, 1), reader.cache_info()['globals'][:2])
+
+    def test_globals_read_only(self):
+        global_placeholders = reader.get_global_placeholders(self.root_path, 'en')
+        with self.assertRaises(TypeError):
+            global_placeholders['global_new'] = Placeholder('global_new', 'new')
+
+    def test_globals_invalidate(self):
+        reader.get_global_placeholders(self.root_path, 'en')
+        reader.invalidate_global_placeholders(self.root_path, 'en')
+        reader.get_global_placeholders(self.root_path, 'en')
+        self.assertEqual((0, 2), reader.cache_info()['globals'][:2])
+
+    def test_preload(self):
+        contents, styles = reader.preload(self.root_path, fs.emails(self.root_path))
+        self.assertTrue(contents)
+        self.assertTrue(styles)
+        info = reader.cache_info()
+        with patch('email_parser.reader.fs.read_file', wraps=reader.fs.read_file) as mock_read:
+            reader.read(self.root_path, fs.email(self.root_path, 'email', 'en'))
+        # only the email itself is read, its template, styles and globals come from the caches
+        self.assertEqual(1, mock_read.call_count)
+        for name in ('templates', 'styles', 'globals'):
+            self.assertEqual(info[name].misses, reader.cache_info()[name].misses)
+
+
 class TestParsing(TestCase):
     def test_parsing_meta_complex(self):
         placeholder_str = 'text:name:arg1=0;arg2=abcd'
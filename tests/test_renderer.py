@@ -1,10 +1,28 @@
 from unittest import TestCase
 from unittest.mock import patch
 
+import pystache
+
 from email_parser.model import *
 from email_parser import renderer, const, config
 
 
+class TestMarkdown(TestCase):
+    def test_engine_reused(self):
+        self.assertIs(renderer._markdown_pool.get('base'), renderer._markdown_pool.get('base'))
+        self.assertIsNot(renderer._markdown_pool.get('base'), renderer._markdown_pool.get(None))
+
+    def test_no_state_between_conversions(self):
+        renderer._md_to_html('[ref]: http://link.com')
+        actual = renderer._md_to_html('[text][ref]')
+        self.assertEqual('<p>[text][ref]</p>', actual)
+
+    def test_base_url_images(self):
+        actual = renderer._md_to_html('![Alt](/img.jpg)\n\n![Alt](/other.jpg)', 'base')
+        self.assertEqual('<p><img alt="Alt" src="base/img.jpg" style="max-width: 100%;" /></p>\n'
+                         '<p><img alt="Alt" src="base/other.jpg" style="max-width: 100%;" /></p>', actual)
+
+
 class TestTextRenderer(TestCase):
     def setUp(self):
         self.email_locale = 'locale'
@@ -254,3 +272,43 @@ class TestHtmlRenderer(TestCase):
         expected = '<body>{{MY_BITMAP}}</body>'
         result = renderer._transform_extended_tags(content)
         self.assertEqual(result, expected)
+
+
+class TestRenderPlan(TestCase):
+    def test_segments(self):
+        plan = renderer.compile_template('<body>{{bitmap:MY_BITMAP:max-width=160;}}\n<p>{{ content }}</p></body>')
+        self.assertEqual(['<body>', None, '\n<p>', None, '</p></body>'], plan.segments)
+        self.assertEqual([(1, 'MY_BITMAP'), (3, 'content')], plan.slots)
+
+    def test_render(self):
+        plan = renderer.compile_template('<body>{{content}}{{{raw}}}</body>')
+        self.assertEqual('<body><p>a & b</p><br></body>', plan.render({'content': '<p>a & b</p>', 'raw': '<br>'}))
+
+    def test_compiled_once(self):
+        self.assertIs(renderer.compile_template('{{content}}'), renderer.compile_template('{{content}}'))
+
+    def test_sections(self):
+        plan = renderer.compile_template('{{#items}}{{name}} {{/items}}')
+        self.assertEqual('a b ', plan.render({'items': [{'name': 'a'}, {'name': 'b'}]}))
+
+    def test_missing_placeholder(self):
+        plan = renderer.compile_template('{{content}}{{missing}}')
+        with self.assertRaises(pystache.context.KeyNotFoundError):
+            plan.render({'content': ''})
+
+
+class TestRender(TestCase):
+    def setUp(self):
+        self.template = Template('dummy', [], '<style>p {color:red;}</style>', '<body>{{content}}</body>',
+                                 ['subject', 'content'], None)
+        self.placeholders = {
+            'subject': Placeholder('subject', 'dummy subject'),
+            'content': Placeholder('content', 'dummy [link](http://link.com)')
+        }
+
+    def test_markdown_converted_once(self):
+        with patch('email_parser.renderer._md_to_html', wraps=renderer._md_to_html) as mock_md:
+            subject, text, html = renderer.render('en', self.template, self.placeholders)
+        self.assertEqual(1, mock_md.call_count)
+        self.assertEqual('dummy link (http://link.com)', text)
+        self.assertIn('<a href="http://link.com"', html)
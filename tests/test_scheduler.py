@@ -0,0 +1,41 @@
+import concurrent.futures
+from unittest import TestCase
+
+from email_parser import scheduler
+
+
+def _double(chunk):
+    return [item * 2 for item in chunk]
+
+
+class TestScheduler(TestCase):
+    def test_chunk_size(self):
+        self.assertEqual(1, scheduler.chunk_size(0, 4))
+        self.assertEqual(1, scheduler.chunk_size(10, 4))
+        self.assertEqual(7, scheduler.chunk_size(100, 4))
+        self.assertEqual(scheduler.MAX_CHUNK_SIZE, scheduler.chunk_size(100000, 4))
+
+    def test_workers_count(self):
+        self.assertEqual(3, scheduler.workers_count(3))
+        self.assertLessEqual(1, scheduler.workers_count())
+
+    def test_map_chunks(self):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            actual = list(scheduler.map_chunks(executor, _double, list(range(100)), 2))
+        self.assertEqual([(item, item * 2) for item in range(100)], sorted(actual))
+
+    def test_bounded_pending_tasks(self):
+        pending = []
+
+        class RecordingExecutor(concurrent.futures.ThreadPoolExecutor):
+            def submit(self, *args):
+                future = super().submit(*args)
+                pending.append(len([f for f in self.submitted if not f.done()]) + 1)
+                self.submitted.append(future)
+                return future
+
+        with RecordingExecutor(max_workers=2) as executor:
+            executor.submitted = []
+            actual = list(scheduler.map_chunks(executor, _double, list(range(100)), 2))
+        self.assertEqual(100, len(actual))
+        self.assertLessEqual(max(pending), 2 * scheduler.PENDING_PER_WORKER)
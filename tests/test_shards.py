@@ -0,0 +1,74 @@
+import argparse
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from email_parser import cmd, config, fs, shards
+from email_parser.model import *
+from helpers import copy_repository
+
+
+class TestPartition(TestCase):
+    def setUp(self):
+        self.emails = list(fs.emails('tests'))
+
+    def test_all_emails_in_exactly_one_shard(self):
+        partition = shards.partition(self.emails, 3)
+        self.assertEqual(3, len(partition))
+        actual = sorted(email for shard_emails in partition for email in shard_emails)
+        self.assertEqual(sorted(self.emails), actual)
+
+    def test_deterministic(self):
+        self.assertEqual(shards.partition(self.emails, 3), shards.partition(list(reversed(self.emails)), 3))
+
+    def test_balanced_by_size(self):
+        sizes = [sum(os.path.getsize(email.path) for email in shard_emails)
+                 for shard_emails in shards.partition(self.emails, 2)]
+        largest = max(os.path.getsize(email.path) for email in self.emails)
+        self.assertLessEqual(abs(sizes[0] - sizes[1]), largest)
+
+    def test_select(self):
+        self.assertEqual(shards.partition(self.emails, 2)[1], shards.select(self.emails, Shard(2, 2)))
+
+
+class TestMerge(TestCase):
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.roots = []
+        for name in ('shard1', 'shard2', 'merged'):
+            self.roots.append(copy_repository(os.path.join(self.tmp_path, name)))
+        for idx, root_path in enumerate(self.roots[:2]):
+            cmd.parse_emails(root_path, workers=1, shard=Shard(idx + 1, 2))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def _destination(self, root_path):
+        return os.path.join(root_path, config.paths.destination)
+
+    def test_merge(self):
+        merged_path = self.roots[2]
+        missing = shards.merge(merged_path, [self._destination(root_path) for root_path in self.roots[:2]])
+        self.assertEqual([], missing)
+        for email in fs.emails(merged_path):
+            self.assertTrue(fs.parsed_email_exists(merged_path, email))
+
+    def test_destination_is_a_shard(self):
+        shard_paths = [self._destination(root_path) for root_path in self.roots[:2]]
+        missing = shards.merge(self.roots[0], shard_paths)
+        self.assertEqual([], missing)
+        for email in fs.emails(self.roots[0]):
+            self.assertTrue(fs.parsed_email_exists(self.roots[0], email))
+        self.assertEqual([config.paths.destination], [name for name in os.listdir(self.roots[0])
+                                                      if name not in (config.paths.source, config.paths.templates)])
+
+    def test_missing_shard(self):
+        missing = shards.merge(self.roots[2], [self._destination(self.roots[0])])
+        self.assertEqual(sorted(shards.select(list(fs.emails(self.roots[2])), Shard(2, 2))), sorted(missing))
+
+    def test_shard_argument(self):
+        self.assertEqual(Shard(1, 4), cmd._shard('1/4'))
+        for value in ('0/4', '5/4', '1', 'a/b'):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                cmd._shard(value)
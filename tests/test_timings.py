@@ -0,0 +1,40 @@
+from unittest import TestCase
+
+from email_parser import timings, scheduler
+from email_parser.model import *
+
+
+def _email(name):
+    return Email(name, 'en', None)
+
+
+class TestTimings(TestCase):
+    def setUp(self):
+        self.timings = timings.Timings({'en': {'slow': 10.0, 'fast': 1.0}})
+
+    def test_unknown_email_costs_average(self):
+        self.assertEqual([10.0, 5.5], self.timings.costs([_email('slow'), _email('new')]))
+
+    def test_longest_first(self):
+        emails = [_email('fast'), _email('new'), _email('slow')]
+        actual = self.timings.longest_first(emails)
+        self.assertEqual(['slow', 'new', 'fast'], [email.name for email in actual])
+
+    def test_saving(self):
+        render_timings = timings.Timings({'en': {'slow': 8.0, 'a': 1.0, 'b': 1.0, 'c': 1.0, 'd': 1.0}})
+        emails = [_email(name) for name in ('a', 'b', 'c', 'd', 'slow')]
+        ordered = render_timings.longest_first(emails)
+        self.assertEqual(2.0, render_timings.saving(emails, ordered, 2))
+
+    def test_remove(self):
+        self.timings.remove(_email('slow'))
+        self.timings.remove(_email('fast'))
+        self.assertEqual({}, self.timings.durations)
+
+
+class TestMakespan(TestCase):
+    def test_single_worker(self):
+        self.assertEqual(6.0, scheduler.makespan([1.0, 2.0, 3.0], 1))
+
+    def test_no_items(self):
+        self.assertEqual(0.0, scheduler.makespan([], 4))
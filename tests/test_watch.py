@@ -0,0 +1,36 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from email_parser.watch import Watcher
+
+
+class TestWatcher(TestCase):
+    def setUp(self):
+        self.root_path = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root_path, 'en'))
+        self.path = os.path.join(self.root_path, 'en', 'email.xml')
+        self._write(self.path, 'content')
+        self.watcher = Watcher([self.root_path, os.path.join(self.root_path, 'missing')])
+
+    def tearDown(self):
+        shutil.rmtree(self.root_path)
+
+    def _write(self, path, content):
+        with open(path, 'w') as fp:
+            fp.write(content)
+
+    def test_no_changes(self):
+        self.assertEqual([], self.watcher.poll())
+
+    def test_modified(self):
+        self._write(self.path, 'changed content')
+        self.assertEqual([self.path], self.watcher.poll())
+        self.assertEqual([], self.watcher.poll())
+
+    def test_added_and_removed(self):
+        added_path = os.path.join(self.root_path, 'en', 'new.xml')
+        self._write(added_path, 'content')
+        os.remove(self.path)
+        self.assertEqual(sorted([self.path, added_path]), self.watcher.poll())